@@ -3,9 +3,19 @@ import numpy as np
 import os
 import sys
 import re
+import json
+import threading
+import argparse
+import tempfile
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 
-# Fix for Windows console encoding
-sys.stdout.reconfigure(encoding='utf-8')
+from sync_common import (DEFAULT_ANALYSIS_RATE, SyncCancelled, _child_processes, _temp_files,
+                         install_cancel_handlers, track_process, release_resources, refine_peak)
+
+# Fix for Windows console encoding. Line buffered, so a piped reader
+# (the GUI log) gets progress as it is printed
+sys.stdout.reconfigure(encoding='utf-8', line_buffering=True)
 
 def get_ffmpeg_path():
     """Locates ffmpeg executable."""
@@ -19,8 +29,9 @@ def get_audio_info(file_path):
     ffmpeg_path = get_ffmpeg_path()
     command = [ffmpeg_path, '-i', file_path]
     
-    process = subprocess.Popen(command, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+    process = track_process(subprocess.Popen(command, stderr=subprocess.PIPE, stdout=subprocess.PIPE))
     _, stderr = process.communicate()
+    _child_processes.discard(process)
     stderr_str = stderr.decode('utf-8', errors='ignore')
     
     match = re.search(r'Stream #\d+:\d+(?:\[0x[0-9a-f]+\])?(?:\([a-z]+\))?: Audio:.*?, (\d+) Hz, (mono|stereo|(\d+) channels)', stderr_str)
@@ -40,11 +51,117 @@ def get_audio_info(file_path):
             
     return channels, sample_rate
 
-def get_audio_data(file_path, target_sample_rate=None, target_channels=None):
-    """Extracts audio data from a file using ffmpeg."""
+# Relative decode cost of common audio codecs (lower is cheaper)
+CODEC_DECODE_COST = {
+    'ac3': 1, 'aac': 1, 'mp3': 1, 'mp2': 1,
+    'eac3': 2, 'opus': 2, 'vorbis': 2,
+    'pcm': 3, 'flac': 4, 'dts': 5,
+    'dts-hd': 8, 'truehd': 10, 'mlp': 10,
+}
+
+def get_audio_streams(file_path):
+    """
+    Lists the audio streams of a file using ffmpeg.
+    Returns a list of dicts: index, codec, lang, channels, default, commentary.
+    """
     ffmpeg_path = get_ffmpeg_path()
+    command = [ffmpeg_path, '-i', file_path]
     
-    args = [ffmpeg_path, '-i', file_path, '-f', 's16le']
+    process = track_process(subprocess.Popen(command, stderr=subprocess.PIPE, stdout=subprocess.PIPE))
+    _, stderr = process.communicate()
+    _child_processes.discard(process)
+    stderr_str = stderr.decode('utf-8', errors='ignore')
+    
+    streams = []
+    current = None
+    for line in stderr_str.splitlines():
+        match = re.search(r'Stream #0:(\d+)(?:\[0x[0-9a-f]+\])?(?:\(([a-z]+)\))?: (\w+): (.*)', line)
+        if match:
+            current = None
+            if match.group(3) != 'Audio':
+                continue
+            
+            details = match.group(4)
+            codec = details.split(',')[0].strip().lower()
+            if 'dts-hd' in codec:
+                codec = 'dts-hd'  # e.g. "dts (DTS-HD MA)"
+            codec = codec.split(' ')[0]
+            if codec.startswith('pcm_'):
+                codec = 'pcm'
+            
+            channels = 2
+            layout = re.search(r'Hz, ([^,]+)', details)
+            if layout:
+                layout = layout.group(1).strip()
+                if layout == 'mono':
+                    channels = 1
+                elif layout == 'stereo':
+                    channels = 2
+                elif re.match(r'(\d+)\.(\d+)', layout):
+                    front, lfe = re.match(r'(\d+)\.(\d+)', layout).groups()
+                    channels = int(front) + int(lfe)
+                elif re.match(r'(\d+) channels', layout):
+                    channels = int(re.match(r'(\d+) channels', layout).group(1))
+            
+            current = {
+                'index': int(match.group(1)),
+                'codec': codec,
+                'lang': match.group(2) or 'und',
+                'channels': channels,
+                'default': '(default)' in details,
+                'commentary': '(comment)' in details,
+            }
+            streams.append(current)
+        elif current is not None:
+            # Stream metadata follows the stream line
+            title = re.match(r'\s+title\s*:\s*(.*)', line)
+            if title and re.search(r'comment', title.group(1), re.IGNORECASE):
+                current['commentary'] = True
+    
+    return streams
+
+def select_reference_stream(file_path):
+    """
+    Picks the cheapest audio stream to decode for analysis.
+    Prefers the same programme (language) as the stream ffmpeg would pick by
+    default, excludes commentary, then orders by codec cost and channel count.
+    Returns the stream index, or None to let ffmpeg choose.
+    """
+    streams = get_audio_streams(file_path)
+    if len(streams) < 2:
+        return None
+    
+    main_stream = next((st for st in streams if st['default']), streams[0])
+    candidates = [st for st in streams
+                  if st['lang'] == main_stream['lang'] and not st['commentary']]
+    if not candidates:
+        return main_stream['index']
+    
+    best = min(candidates, key=lambda st: (CODEC_DECODE_COST.get(st['codec'], 5), st['channels']))
+    if best is not main_stream:
+        print(f"Reference stream: 0:{best['index']} ({best['codec']}, {best['channels']}ch, {best['lang']}) "
+              f"instead of 0:{main_stream['index']} ({main_stream['codec']}, {main_stream['channels']}ch)")
+    return best['index']
+
+def get_audio_data(file_path, target_sample_rate=None, target_channels=None, stream_index=None,
+                   start_sec=None, duration_sec=None):
+    """
+    Extracts audio data from a file using ffmpeg.
+    start_sec/duration_sec decode only that range (input seek).
+    """
+    ffmpeg_path = get_ffmpeg_path()
+    
+    args = [ffmpeg_path]
+    if start_sec is not None:
+        args.extend(['-ss', f'{start_sec:.3f}'])
+    args.extend(['-i', file_path])
+    if duration_sec is not None:
+        args.extend(['-t', f'{duration_sec:.3f}'])
+    
+    if stream_index is not None:
+        args.extend(['-map', f'0:{stream_index}'])
+    
+    args.extend(['-f', 's16le'])
     
     if target_sample_rate:
         args.extend(['-ar', str(target_sample_rate)])
@@ -56,8 +173,10 @@ def get_audio_data(file_path, target_sample_rate=None, target_channels=None):
     
     print(f"Extracting audio from {os.path.basename(file_path)} (sr={target_sample_rate}, ch={target_channels})...")
     try:
-        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8)
+        process = track_process(subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8))
         raw_data = process.stdout.read()
+        process.wait()
+        _child_processes.discard(process)
         
         if not raw_data:
             raise Exception("No audio data extracted.")
@@ -74,6 +193,114 @@ def get_audio_data(file_path, target_sample_rate=None, target_channels=None):
         print(f"Error extracting audio: {e}")
         sys.exit(1)
 
+# Decoders allowed to run at once. Analysis decodes and the full-quality
+# prefetch share this bound.
+DEFAULT_MAX_DECODERS = 2
+
+class HQPrefetch:
+    """
+    Full-quality decode of the clean audio running in the background to a
+    raw temporary file, memory-mapped once finished. raw_file is the path to
+    decode to (a caller-tracked temp file); without it one is created in the
+    system temp dir.
+    """
+    def __init__(self, pool, file_path, raw_file=None):
+        self.file_path = file_path
+        self.process = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.mapping = None
+        if raw_file is None:
+            fd, raw_file = tempfile.mkstemp(prefix='sync_hq_', suffix='.s16le')
+            os.close(fd)
+        self.raw_file = raw_file
+        _temp_files.add(self.raw_file)
+        self.future = pool.submit(self._decode)
+    
+    def _decode(self):
+        channels, sample_rate = get_audio_info(self.file_path)
+        args = [get_ffmpeg_path(), '-i', self.file_path, '-f', 's16le', '-ar', str(sample_rate),
+                '-ac', str(channels), '-vn', '-y', self.raw_file]
+        with self.lock:
+            if self.cancelled:
+                return None
+            print(f"Prefetching full quality clean audio ({sample_rate}Hz, {channels}ch) in the background...")
+            self.process = track_process(subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        self.process.wait()
+        _child_processes.discard(self.process)
+        if self.process.returncode != 0 and not self.cancelled:
+            raise Exception(f"ffmpeg exited with code {self.process.returncode}")
+        return channels, sample_rate
+    
+    def result(self):
+        """
+        Waits for the decode. Returns (audio, channels, sample_rate); audio is a
+        read-only view of the mapped file, valid until discard().
+        """
+        channels, sample_rate = self.future.result()
+        print("Full quality clean audio ready.")
+        if os.path.getsize(self.raw_file) == 0:
+            raise Exception("No audio data extracted.")
+        if self.mapping is None:
+            with open(self.raw_file, 'rb') as f:
+                self.mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        audio = np.frombuffer(self.mapping, dtype=np.int16)
+        if channels > 1:
+            audio = audio[:len(audio) // channels * channels].reshape((-1, channels))
+        return audio, channels, sample_rate
+    
+    def discard(self):
+        """Stops the decode if still running and removes the temporary file."""
+        with self.lock:
+            self.cancelled = True
+            process = self.process
+        self.future.cancel()
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+        try:
+            self.future.exception() # Wait for the worker before removing its file
+        except BaseException:
+            pass
+        # The mapping must be closed before the file can be removed on Windows
+        if self.mapping is not None:
+            try:
+                self.mapping.close()
+                self.mapping = None
+            except BufferError:
+                pass # Still referenced; removed at exit by release_resources
+        try:
+            os.remove(self.raw_file)
+            _temp_files.discard(self.raw_file)
+        except OSError:
+            pass
+
+class DecodePool:
+    """
+    Runs ffmpeg decoders concurrently on background threads (they spend
+    their time waiting on the pipe, so the GIL is not a bottleneck), at most
+    max_decoders at once; further requests queue in submission order.
+    hq_file is the path for the full-quality prefetch (see HQPrefetch).
+    """
+    def __init__(self, max_decoders=DEFAULT_MAX_DECODERS, hq_file=None):
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_decoders), thread_name_prefix='decoder')
+        self.hq_file = hq_file
+    
+    def submit(self, fn, *args, **kwargs):
+        return self.executor.submit(fn, *args, **kwargs)
+    
+    def decode(self, file_path, target_sample_rate=None, target_channels=None, stream_index=None):
+        """get_audio_data on the pool. Returns a Future."""
+        return self.submit(get_audio_data, file_path, target_sample_rate, target_channels, stream_index)
+    
+    def prefetch_hq(self, file_path):
+        """Starts the full-quality decode of file_path. Returns an HQPrefetch."""
+        raw_file, self.hq_file = self.hq_file, None # The given path is used once
+        return HQPrefetch(self, file_path, raw_file)
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 def is_silence_at(audio, position, window_samples, threshold=100):
     """
     Checks if audio is silent at given position using RMS over a window.
@@ -143,8 +370,8 @@ def calculate_delay_progressive(clean, ref, pos_clean, pos_ref_expected, sample_
         quality = peak_value / len(clean_norm)
         quality = np.clip(quality, 0.0, 1.0)
         
-        # Calculate delay
-        delay = (peak_idx - (len(clean_norm) - 1)) - search_margin
+        # Calculate delay (sub-sample)
+        delay = (peak_idx + refine_peak(correlation, peak_idx) - (len(clean_norm) - 1)) - search_margin
         
         # Update best
         if quality > best_quality:
@@ -161,6 +388,149 @@ def calculate_delay_progressive(clean, ref, pos_clean, pos_ref_expected, sample_
     
     return best_delay, best_quality, best_window
 
+def correlate_blockwise(probe, ref, block_size=1 << 20, max_workers=None):
+    """
+    Finds the best match of 'probe' anywhere in 'ref' using overlap-save FFT
+    blocks of fixed size, so memory stays bounded regardless of ref length.
+    Blocks are correlated in parallel (numpy FFTs release the GIL).
+    Returns (ref_position, quality) where quality is the normalized
+    correlation coefficient at the peak.
+    """
+    m = len(probe)
+    if m == 0 or len(ref) < m:
+        return -1, 0.0
+    
+    probe = probe.astype(np.float64)
+    probe -= np.mean(probe)
+    probe_norm = np.sqrt(np.sum(probe**2))
+    if probe_norm < 1e-6:
+        return -1, 0.0
+    
+    # Each block yields n_fft - m + 1 valid lags
+    n_fft = block_size
+    while n_fft < 2 * m:
+        n_fft <<= 1
+    step = n_fft - m + 1
+    n_lags = len(ref) - m + 1
+    
+    fft_probe = np.conj(np.fft.rfft(probe, n=n_fft))
+    
+    def process_block(lag_start):
+        lag_count = min(step, n_lags - lag_start)
+        seg = ref[lag_start : lag_start + lag_count + m - 1].astype(np.float64)
+        
+        correlation = np.fft.irfft(np.fft.rfft(seg, n=n_fft) * fft_probe, n=n_fft)[:lag_count]
+        
+        # Local energy of ref under the probe at every lag (probe is zero-mean,
+        # so subtracting the local mean only affects the energy term)
+        csum = np.concatenate(([0.0], np.cumsum(seg)))
+        csum2 = np.concatenate(([0.0], np.cumsum(seg**2)))
+        local_sum = csum[m:m + lag_count] - csum[:lag_count]
+        local_energy = csum2[m:m + lag_count] - csum2[:lag_count] - local_sum**2 / m
+        local_energy = np.maximum(local_energy, 1e-6)
+        
+        score = correlation / (np.sqrt(local_energy) * probe_norm)
+        # Near-silent ref regions give meaningless scores
+        score[local_energy < m] = 0.0
+        
+        peak = int(np.argmax(score))
+        return lag_start + peak + refine_peak(score, peak), float(score[peak])
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process_block, range(0, n_lags, step)))
+    
+    return max(results, key=lambda r: r[1])
+
+def estimate_global_offset(clean, ref, sample_rate, num_probes=6, probe_sec=20, block_size=1 << 20, max_workers=None):
+    """
+    Estimates a large global offset by searching a set of probe segments from
+    'clean' across the whole of 'ref' with blockwise correlation.
+    Probes vote for a delay; the delay with the highest total quality wins.
+    Returns (delay_samples, quality), or (0, 0.0) if the probes do not agree.
+    """
+    probe_len = int(probe_sec * sample_rate)
+    if len(clean) < probe_len or len(ref) < probe_len:
+        return 0, 0.0
+    
+    # Evenly spaced probes, avoiding the very start and end
+    positions = np.linspace(0, len(clean) - probe_len, num_probes + 2)[1:-1].astype(int)
+    
+    votes = [] # (delay, quality)
+    for pos in positions:
+        probe = clean[pos : pos + probe_len]
+        if np.std(probe) < 1:
+            continue # Silence
+        
+        match_pos, quality = correlate_blockwise(probe, ref, block_size, max_workers)
+        if match_pos < 0 or quality < 0.25:
+            continue
+        
+        delay = match_pos - pos
+        print(f"  Probe at {pos/sample_rate:.1f}s -> delay {delay/sample_rate:.3f}s (quality: {quality:.3f})")
+        votes.append((delay, quality))
+    
+    if not votes:
+        return 0, 0.0
+    
+    # Group delays within 100ms of each other and pick the strongest group
+    tolerance = 0.1 * sample_rate
+    best_group = []
+    for delay, _ in votes:
+        group = [(d, q) for d, q in votes if abs(d - delay) <= tolerance]
+        if sum(q for _, q in group) > sum(q for _, q in best_group):
+            best_group = group
+    
+    # A single probe is not enough evidence when several were searched
+    if len(votes) > 1 and len(best_group) < 2:
+        return 0, 0.0
+    
+    best_delay = int(np.median([d for d, _ in best_group]))
+    best_quality = max(q for _, q in best_group)
+    return best_delay, best_quality
+
+def fit_delay_model(points, sample_rate, tolerance_sec=0.02, min_points=10):
+    """
+    Tests whether delay points fit a constant offset or a linear drift
+    (delay = intercept + slope * time) within tolerance_sec.
+    points: list of (time, delay) in samples.
+    Returns a dict (model, delay_ms, factor, max_residual_ms), or None if
+    neither model fits and the audio has to be rebuilt segment by segment.
+    """
+    if len(points) < min_points:
+        return None
+    
+    times = np.array([p[0] for p in points], dtype=np.float64)
+    delays = np.array([p[1] for p in points], dtype=np.float64)
+    tolerance = tolerance_sec * sample_rate
+    
+    median_delay = float(np.median(delays))
+    residual = np.max(np.abs(delays - median_delay))
+    if residual <= tolerance:
+        return {
+            'model': 'constant',
+            'delay_ms': median_delay / sample_rate * 1000,
+            'factor': 1.0,
+            'max_residual_ms': float(residual) / sample_rate * 1000,
+        }
+    
+    slope, intercept = np.polyfit(times, delays, 1)
+    residual = np.max(np.abs(delays - (intercept + slope * times)))
+    if residual <= tolerance:
+        # Output time = t + intercept + slope * t = intercept + (1 + slope) * t
+        return {
+            'model': 'linear',
+            'delay_ms': float(intercept) / sample_rate * 1000,
+            'factor': 1.0 + float(slope),
+            'max_residual_ms': float(residual) / sample_rate * 1000,
+        }
+    
+    return None
+
+def write_model(model_file, model):
+    """Writes a fitted delay model as JSON for the caller (mkvmerge --sync)."""
+    with open(model_file, 'w') as f:
+        json.dump(model, f)
+
 def save_wav(audio_data, sample_rate, channels, output_path):
     """Saves audio data to WAV using ffmpeg."""
     ffmpeg_path = get_ffmpeg_path()
@@ -176,74 +546,436 @@ def save_wav(audio_data, sample_rate, channels, output_path):
     ]
     
     try:
-        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process = track_process(subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
         process.communicate(input=audio_data.tobytes())
+        _child_processes.discard(process)
         print(f"Saved: {output_path}")
     except Exception as e:
         print(f"Error saving WAV: {e}")
 
-def sliding_window_sync(clean_file, reference_file, output_file):
+def load_analysis_audio(clean_file, reference_file, sample_rate, ref_stream='auto', decoders=None):
     """
-    Continuous synchronization using sliding window cross-correlation.
-    Scans the entire audio in steps, calculating delay at each point.
+    Decodes clean and reference audio as mono at the analysis rate, both at
+    once on the decoders pool (a private one if None).
+    Returns (clean, ref).
     """
-    ANALYSIS_RATE = 8000
-    WINDOW_SIZE = 10 * ANALYSIS_RATE  # 10 seconds window
-    STEP_SIZE = 1 * ANALYSIS_RATE     # 1 second step
-    SEARCH_MARGIN = 4 * ANALYSIS_RATE # +/- 4 seconds search (Strict margin to ignore 7s/32s errors)
+    pool = decoders or DecodePool()
     
-    print("=== Continuous Sliding Window Synchronization ===\n")
+    def load_reference():
+        stream = select_reference_stream(reference_file) if ref_stream == 'auto' else ref_stream
+        return get_audio_data(reference_file, sample_rate, target_channels=1, stream_index=stream)
+    
+    print("Loading Clean and Reference audio...")
+    try:
+        clean_future = pool.decode(clean_file, sample_rate, target_channels=1)
+        ref_future = pool.submit(load_reference)
+        clean, ref = clean_future.result(), ref_future.result()
+    finally:
+        if decoders is None:
+            pool.shutdown()
+    
+    print(f"\nClean: {len(clean)/sample_rate:.1f}s")
+    print(f"Reference: {len(ref)/sample_rate:.1f}s\n")
+    return clean, ref
+
+def find_initial_offset(clean, ref, sample_rate):
+    """Runs the blockwise global offset estimate and reports it. Returns samples."""
+    print("Estimating global offset (blockwise)...")
+    initial_offset, global_quality = estimate_global_offset(clean, ref, sample_rate)
+    if global_quality > 0:
+        print(f"  Global offset: {initial_offset/sample_rate:.3f}s (quality: {global_quality:.3f})\n")
+    else:
+        print("  No consistent global offset found. Starting around 0.\n")
+    return initial_offset
+
+# Search margin around delays predicted by a prior (see load_prior)
+PRIOR_MARGIN_SEC = 1.0
+# Search margin of the dense scan around the last accepted delay
+SCAN_MARGIN_SEC = 4
+# Prior delays the dense scan also tries with the tight margin (most common first)
+PRIOR_SCAN_CENTRES = 2
+# Windows in a row without a tight match before the scan stops trying the
+# tight searches, until the wide search accepts a point again
+PRIOR_SCAN_MISSES = 3
+
+def load_prior(prior_file, sample_rate, max_delays=8):
+    """
+    Reads the delay maps of episodes of the same series processed earlier,
+    as written by --delay-map-out ({"episodes": [{"segments": [{start, end,
+    delay}]}]}, seconds), and summarises them in samples:
+      initial: the usual delay at the start of an episode
+      delays: the delays that covered the most time, most common first
+    Returns None if there is nothing usable.
+    """
+    try:
+        with open(prior_file) as f:
+            episodes = json.load(f).get('episodes', [])
+    except (OSError, ValueError) as e:
+        print(f"Could not read prior {prior_file}: {e}")
+        return None
+    
+    episodes = [e for e in episodes if e.get('segments')]
+    if not episodes:
+        return None
+    
+    # Weigh each delay (in 50ms bins) by the time it covered
+    bins = {}
+    for episode in episodes:
+        for seg in episode['segments']:
+            key = round(seg['delay'] / 0.05)
+            total, weight = bins.get(key, (0.0, 0.0))
+            duration = max(seg['end'] - seg['start'], 1e-3)
+            bins[key] = (total + seg['delay'] * duration, weight + duration)
+    ranked = sorted(bins.values(), key=lambda b: -b[1])[:max_delays]
+    
+    return {
+        'initial': float(np.median([e['segments'][0]['delay'] for e in episodes])) * sample_rate,
+        'delays': [total / weight * sample_rate for total, weight in ranked],
+        'episodes': len(episodes),
+    }
+
+def prior_initial_offset(clean, ref, sample_rate, prior, num_probes=4, probe_sec=20, margin_sec=PRIOR_MARGIN_SEC):
+    """
+    Confirms the prior's delays near the start of the title with a few probes,
+    each searched only +/- margin_sec around the predicted delays. Much cheaper
+    than a global search.
+    Returns the initial offset in samples, or None if the probes do not agree.
+    """
+    probe_len = int(probe_sec * sample_rate)
+    margin = int(margin_sec * sample_rate)
+    # Probes spread over the first quarter, where the initial delay applies
+    span = min(len(clean) // 4, len(clean) - probe_len)
+    if span <= 0:
+        return None
     
-    # Helper to verify a delay at a future position
-    def verify_delay(clean, ref, check_pos, proposed_delay, rate, win_size):
-        if check_pos >= len(clean) - win_size:
+    centres = [prior['initial']] + [d for d in prior['delays'] if abs(d - prior['initial']) > margin]
+    votes = []
+    for pos in np.linspace(0, span, num_probes + 2)[1:-1].astype(int):
+        probe = clean[pos : pos + probe_len]
+        if np.std(probe) < 1:
+            continue # Silence
+        for centre in centres:
+            search_start = max(0, int(pos + centre - margin))
+            search_end = min(len(ref), int(pos + centre + probe_len + margin))
+            match_pos, quality = correlate_blockwise(probe, ref[search_start:search_end], block_size=1 << 18)
+            if match_pos >= 0 and quality >= 0.4:
+                votes.append(search_start + match_pos - pos)
+                break
+    
+    if len(votes) < max(2, num_probes // 2):
+        return None
+    
+    # The earliest probes decide, as long as the majority agrees with them
+    tolerance = 0.1 * sample_rate
+    first = votes[0]
+    group = [d for d in votes if abs(d - first) <= tolerance]
+    if len(group) * 2 < len(votes) + 1:
+        return None
+    return float(np.median(group))
+
+def find_start_offset(clean, ref, sample_rate, global_search=True, prior=None):
+    """
+    Initial offset for the scan: from the prior when its prediction holds,
+    otherwise the blockwise global estimate (or 0 without global_search).
+    """
+    if prior is not None:
+        print(f"Checking prior from {prior['episodes']} earlier episode(s) "
+              f"(initial delay {prior['initial']/sample_rate:.3f}s)...")
+        offset = prior_initial_offset(clean, ref, sample_rate, prior)
+        if offset is not None:
+            print(f"  Prior confirmed: initial offset {offset/sample_rate:.3f}s\n")
+            return offset
+        print("  Prior did not match. Falling back to a full search.")
+    return find_initial_offset(clean, ref, sample_rate) if global_search else 0
+
+def write_delay_map(delay_map_file, segments, sample_rate):
+    """Writes (start, end, delay) segments in seconds, for use as a prior by later episodes."""
+    with open(delay_map_file, 'w') as f:
+        json.dump({
+            'segments': [{'start': s / sample_rate, 'end': e / sample_rate, 'delay': d / sample_rate}
+                         for s, e, d in segments],
+        }, f)
+
+# Largest difference between a probe delay and the segment engine's delay there
+SEGMENT_CHECK_SEC = 0.05
+
+def segment_splits(num_cuts):
+    """Number of silences smart_synchronize splits at for a title with num_cuts cuts."""
+    return max(10, num_cuts * 4)
+
+def cuts_at_silences(clean, sample_rate, probes, num_splits, step_sec=0.1):
+    """
+    Whether every delay step between consecutive probes (time, delay) has a
+    silence between the two probes among the num_splits longest ones
+    smart_synchronize would split at. Otherwise a cut would fall inside
+    one of its segments and get a single delay.
+    """
+    from smart_synchronize import find_silence_intervals, get_top_n_longest_silences
+    silences = get_top_n_longest_silences(find_silence_intervals(clean, sample_rate), num_splits,
+                                          min_duration_sec=1.0, sample_rate=sample_rate)
+    for (t0, d0), (t1, d1) in zip(probes, probes[1:]):
+        if abs(d1 - d0) <= step_sec * sample_rate:
+            continue
+        if not any(t0 <= (start + end) / 2 <= t1 for start, end, _ in silences):
+            print(f"  No split silence between {t0/sample_rate:.1f}s and {t1/sample_rate:.1f}s, "
+                  f"where the delay changes.")
             return False
-            
-        c_seg = clean[check_pos : check_pos + win_size]
-        
-        # Check at proposed_delay
-        r_start = int(check_pos + proposed_delay)
-        if r_start < 0 or r_start + win_size > len(ref):
+    return True
+
+def segments_match_probes(segments, clean, ref, probes, probe_len, sample_rate, step_sec=0.1, check_sec=5):
+    """
+    Checks a delay map against the probes (time, delay): each probe must
+    agree within SEGMENT_CHECK_SEC with a segment its window overlaps, and
+    between two probes with different delays, every check_sec window inside
+    a segment must align at least as well at the segment's delay as at
+    either probe delay (a cut away from the split silences shows up there).
+    """
+    tolerance = SEGMENT_CHECK_SEC * sample_rate
+    for t, d in probes:
+        overlapping = [delay for start, end, delay in segments
+                       if start < t + probe_len / 2 and end > t - probe_len / 2]
+        if overlapping and not any(abs(delay - d) <= tolerance for delay in overlapping):
+            print(f"  Segment delay at {t/sample_rate:.1f}s disagrees with the probe ({d/sample_rate:.3f}s).")
             return False
-            
-        r_seg = ref[r_start : r_start + win_size]
+    
+    win = int(check_sec * sample_rate)
+    for (t0, d0), (t1, d1) in zip(probes, probes[1:]):
+        if abs(d1 - d0) <= step_sec * sample_rate:
+            continue
+        for start, end, delay in segments:
+            for pos in range(max(start, int(t0)), min(end, int(t1)) - win, win):
+                score = score_alignment(clean, ref, pos, round(delay), win)
+                others = [score_alignment(clean, ref, pos, round(other), win) for other in (d0, d1)]
+                others = [o for o in others if o is not None]
+                if score is not None and others and score < max(others) - 0.1:
+                    print(f"  Segment delay at {pos/sample_rate:.1f}s aligns worse than a probe delay.")
+                    return False
+    return True
+
+def plan_sync(clean, ref, sample_rate, initial_offset=0, num_probes=20, probe_sec=10, margin_sec=30):
+    """
+    Classifies a job from a cheap sampled probe: a handful of correlation
+    windows spread across the timeline, each searched +/- margin_sec around
+    initial_offset.
+    Returns a dict with:
+      class: 'constant', 'drift', 'cuts' or 'unreliable'
+      engine: 'model' (mux with --sync), 'segments' (smart_synchronize) or 'dense'
+      model: fitted delay model for engine 'model'
+      cuts: number of delay changes seen between probes
+    The 'cuts' class also returns the matched probes (time, delay) and
+    probe_len, to check the segment engine's delay map against.
+    """
+    probe_len = int(probe_sec * sample_rate)
+    margin = int(margin_sec * sample_rate)
+    if len(clean) < probe_len * 2:
+        return {'class': 'unreliable', 'engine': 'dense', 'model': None, 'cuts': 0}
+    
+    positions = np.linspace(0, len(clean) - probe_len, num_probes + 2)[1:-1].astype(int)
+    probes = [] # (time, delay, quality)
+    for pos in positions:
+        seg = clean[pos : pos + probe_len]
+        if np.std(seg) < 1:
+            continue # Silence
+        search_start = max(0, int(pos + initial_offset - margin))
+        search_end = min(len(ref), int(pos + initial_offset + probe_len + margin))
+        match_pos, quality = correlate_blockwise(seg, ref[search_start:search_end], block_size=1 << 18)
+        if match_pos >= 0:
+            # Delay measured over the window belongs to its centre
+            probes.append((pos + probe_len / 2, search_start + match_pos - pos, quality))
+    
+    valid = [(t, d) for t, d, q in probes if q >= 0.4]
+    print(f"  Probe: {len(valid)}/{len(positions)} windows matched")
+    if len(valid) < max(4, 0.6 * len(positions)):
+        return {'class': 'unreliable', 'engine': 'dense', 'model': None, 'cuts': 0}
+    
+    model = fit_delay_model(valid, sample_rate, min_points=4)
+    if model:
+        job_class = 'constant' if model['model'] == 'constant' else 'drift'
+        return {'class': job_class, 'engine': 'model', 'model': model, 'cuts': 0}
+    
+    # Piecewise constant delays: steps between probes, flat in between
+    tolerance = 0.02 * sample_rate
+    steps = [abs(valid[k][1] - valid[k - 1][1]) for k in range(1, len(valid))]
+    cuts = sum(1 for step in steps if step > 0.1 * sample_rate)
+    drifting = sum(1 for step in steps if tolerance < step <= 0.1 * sample_rate)
+    
+    if cuts > 0 and drifting == 0:
+        # smart_synchronize accepts at most 0.3s of change per segment, and
+        # can only change the delay at the silences it splits at
+        small_cuts = all(step <= 0.3 * sample_rate for step in steps)
+        engine = 'dense'
+        if small_cuts and cuts_at_silences(clean, sample_rate, valid, segment_splits(cuts)):
+            engine = 'segments'
+        return {'class': 'cuts', 'engine': engine, 'model': None, 'cuts': cuts,
+                'probes': valid, 'probe_len': probe_len}
+    
+    return {'class': 'drift', 'engine': 'dense', 'model': None, 'cuts': cuts}
+
+# Post-processing parameters of the dense scan. The scan itself only depends
+# on the first three (they steer where the next window is searched), so all
+# of them can be re-tuned from a saved scan with resegment().
+SEGMENT_DEFAULTS = {
+    'min_quality': 0.25,  # Correlation quality needed to accept a window
+    'jump_sec': 2.0,      # Larger delay jumps must be confirmed by the next window
+    'verify_score': 0.2,  # Correlation needed to confirm a jump
+    'change_sec': 0.1,    # Delay change that starts a new segment
+    'filter_window': 5,   # Points in the median filter
+    'look_ahead': 3,      # Points that must agree before a segment change
+}
+
+SCAN_CANDIDATES = 3 # Correlation peaks kept per window in the scan artifact
+
+def score_alignment(clean, ref, check_pos, delay, win_size):
+    """
+    Correlation coefficient between clean at check_pos and ref at
+    check_pos + delay. Returns None where it cannot be measured (end of
+    audio or silence).
+    """
+    if check_pos >= len(clean) - win_size:
+        return None
         
-        # Quick correlation check
-        c_norm = c_seg.astype(np.float32) - np.mean(c_seg)
-        r_norm = r_seg.astype(np.float32) - np.mean(r_seg)
+    c_seg = clean[check_pos : check_pos + win_size]
+    
+    r_start = int(check_pos + delay)
+    if r_start < 0 or r_start + win_size > len(ref):
+        return None
         
-        if np.std(c_norm) < 1 or np.std(r_norm) < 1:
-            return False # Silence, can't verify
-            
-        # Direct correlation coefficient
-        corr = np.sum(c_norm * r_norm)
-        norm_factor = np.sqrt(np.sum(c_norm**2) * np.sum(r_norm**2))
+    r_seg = ref[r_start : r_start + win_size]
+    
+    c_norm = c_seg.astype(np.float32) - np.mean(c_seg)
+    r_norm = r_seg.astype(np.float32) - np.mean(r_seg)
+    
+    if np.std(c_norm) < 1 or np.std(r_norm) < 1:
+        return None # Silence, can't verify
         
-        if norm_factor < 1e-6:
-            return False
-            
-        score = corr / norm_factor
-        return score > 0.2 # Threshold for verification
+    # Direct correlation coefficient
+    corr = np.sum(c_norm * r_norm)
+    norm_factor = np.sqrt(np.sum(c_norm**2) * np.sum(r_norm**2))
     
-    # Load audios
-    print("Loading Clean audio...")
-    clean = get_audio_data(clean_file, ANALYSIS_RATE, target_channels=1)
+    if norm_factor < 1e-6:
+        return None
+        
+    return float(corr / norm_factor)
+
+def top_peaks(correlation, count, exclusion):
+    """Indices of the 'count' highest peaks, at least 'exclusion' samples apart."""
+    corr = correlation.copy()
+    peaks = []
+    for _ in range(count):
+        idx = int(np.argmax(corr))
+        if not np.isfinite(corr[idx]):
+            break
+        peaks.append(idx)
+        corr[max(0, idx - exclusion) : idx + exclusion + 1] = -np.inf
+    return peaks
+
+def accept_window(delay, quality, verify_score, last_delay, sample_rate, params):
+    """
+    Decides whether a scanned window becomes a delay point.
+    last_delay is the delay of the previous accepted point (None for the first).
+    Jumps larger than jump_sec (from 0 for the first point) are glitches such
+    as a missing sound effect unless the next window confirms them.
+    """
+    reference = 0 if last_delay is None else last_delay
+    if abs(delay - reference) > params['jump_sec'] * sample_rate:
+        return verify_score is not None and verify_score > params['verify_score']
+    return quality > params['min_quality']
+
+def prior_centres(last_delay, prior_delays, margin, wide_margin):
+    """
+    Search centres for a tight scan: the last delay first, then each prior
+    delay the wide search around the last delay (+/- wide_margin) would not
+    reach anyway and no earlier centre's margin covers.
+    """
+    centres = [last_delay]
+    for delay in prior_delays:
+        if abs(delay - last_delay) > wide_margin and all(abs(delay - c) > margin for c in centres):
+            centres.append(delay)
+    return centres
+
+def reachable(delay, centres, margin, window_size, valid_only):
+    """
+    Whether search_window could have returned delay when searching around
+    any of centres. Full correlations also reach the partial overlaps at
+    either end of the range.
+    """
+    reach = margin + (0 if valid_only else window_size - 1) + 1 # +1 for sub-sample refinement
+    return any(abs(delay - c) <= reach for c in centres)
+
+def search_window(clean_norm, ref, i, centre, margin, exclusion, valid_only=False):
+    """
+    Correlates a normalized clean window (starting at i) against ref around
+    i + centre +/- margin. valid_only keeps just the lags where the window
+    lies fully inside the search range, which allows an FFT half the size.
+    Candidate peaks are at least exclusion samples apart.
+    Returns the top (delay, quality) candidates, best first, or None if the
+    range is too short or silent.
+    """
+    window_size = len(clean_norm)
+    expected_ref_pos = i + centre
+    ref_start = max(0, int(expected_ref_pos - margin))
+    ref_end = min(len(ref), int(expected_ref_pos + window_size + margin))
     
-    print("Loading Reference audio...")
-    ref = get_audio_data(reference_file, ANALYSIS_RATE, target_channels=1)
+    ref_seg = ref[ref_start : ref_end]
+    if len(ref_seg) < window_size:
+        return None
     
-    print(f"\nClean: {len(clean)/ANALYSIS_RATE:.1f}s")
-    print(f"Reference: {len(ref)/ANALYSIS_RATE:.1f}s\n")
+    ref_norm = ref_seg.astype(np.float32)
+    ref_norm -= np.mean(ref_norm)
+    std_ref = np.std(ref_norm)
+    if std_ref < 1:
+        return None
+    ref_norm /= std_ref
     
-    # 1. Collect delay points
-    raw_points = [] # List of (time, delay, quality)
+    # FFT Correlation
+    if valid_only:
+        n_fft = 1 << (len(ref_norm) - 1).bit_length()
+        fft_clean = np.conj(np.fft.rfft(clean_norm, n=n_fft))
+        correlation = np.fft.irfft(np.fft.rfft(ref_norm, n=n_fft) * fft_clean, n=n_fft)[:len(ref_norm) - window_size + 1]
+        lag_offset = 0
+    else:
+        n_fft = 1 << (len(clean_norm) + len(ref_norm) - 1).bit_length()
+        fft_clean = np.fft.rfft(np.flip(clean_norm), n=n_fft)
+        fft_ref = np.fft.rfft(ref_norm, n=n_fft)
+        correlation = np.fft.irfft(fft_clean * fft_ref)
+        lag_offset = window_size - 1
     
-    print("Scanning audio with sliding window...")
+    # Best peak first; runners-up are kept for offline inspection
+    candidates = []
+    for peak_idx in top_peaks(correlation, SCAN_CANDIDATES, exclusion):
+        shift = peak_idx + refine_peak(correlation, peak_idx) - lag_offset
+        candidates.append((ref_start + shift - i, correlation[peak_idx] / window_size))
+    return candidates
+
+def scan_windows(clean, ref, sample_rate, initial_offset, params=SEGMENT_DEFAULTS, prior=None):
+    """
+    Dense sliding window scan: a 10s window every second, searched +/- 4s
+    around the last accepted delay. With a prior (see load_prior) each window
+    is first searched +/- PRIOR_MARGIN_SEC around the last delay and then
+    around the PRIOR_SCAN_CENTRES most common prior delays beyond the wide
+    margin, widening to 4s around the last delay when none gives an
+    acceptable point. After PRIOR_SCAN_MISSES windows in a row without a
+    tight match, only the wide search runs until it accepts a point again.
+    Returns (raw_points, scan). raw_points are the accepted (time, delay,
+    quality) tuples; scan holds every measured window (position, top
+    candidate delays and qualities, verify score of the best candidate,
+    search margin used) and the prior's delays, so the acceptance can be
+    replayed with other parameters.
+    """
+    WINDOW_SIZE = 10 * sample_rate  # 10 seconds window
+    STEP_SIZE = 1 * sample_rate     # 1 second step
+    SEARCH_MARGIN = SCAN_MARGIN_SEC * sample_rate # +/- 4 seconds search (Strict margin to ignore 7s/32s errors)
     
-    # We assume the delay is relatively small (within SEARCH_MARGIN)
-    # If there is a large offset (e.g. > 10s), it's likely an error or requires manual sync.
-    # We start searching around 0.
-    initial_offset = 0
+    margins = [SEARCH_MARGIN]
+    prior_delays = []
+    if prior is not None:
+        margins.insert(0, int(PRIOR_MARGIN_SEC * sample_rate))
+        prior_delays = list(prior['delays'][:PRIOR_SCAN_CENTRES])
+    
+    raw_points = [] # List of (time, delay, quality)
+    positions, delays, qualities, verify_scores, used_margins = [], [], [], [], []
+    prior_matches = 0
+    misses = 0 # Windows in a row the tight searches did not match
     
     # Start scanning from the beginning (we don't skip any time)
     for i in range(0, len(clean) - WINDOW_SIZE, STEP_SIZE):
@@ -257,98 +989,134 @@ def sliding_window_sync(clean_file, reference_file, output_file):
         else:
             last_delay = raw_points[-1][1]
         
-        # Center search on expected position
-        expected_ref_pos = i + last_delay
-        ref_start = max(0, int(expected_ref_pos - SEARCH_MARGIN))
-        ref_end = min(len(ref), int(expected_ref_pos + WINDOW_SIZE + SEARCH_MARGIN))
-        
-        ref_seg = ref[ref_start : ref_end]
-        
-        if len(clean_seg) < WINDOW_SIZE or len(ref_seg) < WINDOW_SIZE:
+        if len(clean_seg) < WINDOW_SIZE:
             continue
             
         # Normalize
         clean_norm = clean_seg.astype(np.float32)
-        ref_norm = ref_seg.astype(np.float32)
-        
         clean_norm -= np.mean(clean_norm)
-        ref_norm -= np.mean(ref_norm)
-        
         std_clean = np.std(clean_norm)
-        std_ref = np.std(ref_norm)
-        
-        if std_clean < 1 or std_ref < 1:
+        if std_clean < 1:
             continue
-            
         clean_norm /= std_clean
-        ref_norm /= std_ref
-        
-        # FFT Correlation
-        n_fft = 1 << (len(clean_norm) + len(ref_norm) - 1).bit_length()
-        fft_clean = np.fft.rfft(np.flip(clean_norm), n=n_fft)
-        fft_ref = np.fft.rfft(ref_norm, n=n_fft)
-        correlation = np.fft.irfft(fft_clean * fft_ref)
-        
-        peak_idx = np.argmax(correlation)
-        peak_value = correlation[peak_idx]
-        quality = peak_value / len(clean_norm)
-        
-        shift = peak_idx - (len(clean_norm) - 1)
-        ref_match_pos = ref_start + shift
-        delay = ref_match_pos - i
-        
-        # CLAMP & VERIFY: 
-        # If delay jumps significantly (>2s), verify it's not a glitch (like missing sound effect).
-        # We check the NEXT window to see if it agrees with this new delay.
         
-        is_valid_point = False
-        
-        if not raw_points:
-            # First point: Accept if quality is decent, or verify if it's a large jump from 0
-            if abs(delay) > 2 * ANALYSIS_RATE:
-                # Large initial offset? Verify with next window
-                print(f"  ? Potential large initial offset {delay/ANALYSIS_RATE:.3f}s. Verifying...")
-                if verify_delay(clean, ref, i + STEP_SIZE, delay, ANALYSIS_RATE, WINDOW_SIZE):
-                    is_valid_point = True
-                    print(f"  ✓ Verified initial offset.")
-                else:
-                    print(f"  ✗ Could not verify. Ignoring.")
-            elif quality > 0.25:
-                is_valid_point = True
-        else:
-            last_valid_delay = raw_points[-1][1]
-            jump = abs(delay - last_valid_delay)
+        previous = raw_points[-1][1] if raw_points else None
+        # Tight searches around the last delay and the prior's delays, then
+        # the wide search around the last delay
+        attempts = []
+        if misses < PRIOR_SCAN_MISSES:
+            attempts = [(margin, centre) for margin in margins[:-1]
+                        for centre in prior_centres(last_delay, prior_delays, margin, SEARCH_MARGIN)]
+        attempts.append((SEARCH_MARGIN, last_delay))
+        result = None
+        for margin, centre in attempts:
+            tight = margin < SEARCH_MARGIN
+            candidates = search_window(clean_norm, ref, i, centre, margin, sample_rate // 10, valid_only=tight)
+            if candidates is None:
+                continue
+            delay, quality = candidates[0]
             
-            if jump > (2 * ANALYSIS_RATE):
-                # Large jump detected. Is it real (scene cut) or glitch (missing audio)?
-                # Verify with next window
-                # print(f"  ? Jump detected ({last_valid_delay/ANALYSIS_RATE:.2f}s -> {delay/ANALYSIS_RATE:.2f}s). Verifying...")
-                
-                if verify_delay(clean, ref, i + STEP_SIZE, delay, ANALYSIS_RATE, WINDOW_SIZE):
-                    is_valid_point = True
-                    # print(f"  ✓ Jump verified.")
-                else:
-                    # print(f"  ✗ Jump rejected (glitch/missing audio). Keeping previous delay.")
-                    pass
-            elif quality > 0.25:
-                is_valid_point = True
+            # CLAMP & VERIFY: 
+            # If delay jumps significantly (>2s), verify it's not a glitch (like missing sound effect).
+            # We check the NEXT window to see if it agrees with this new delay.
+            verify_score = score_alignment(clean, ref, i + STEP_SIZE, delay, WINDOW_SIZE)
+            is_valid_point = accept_window(delay, quality, verify_score, previous, sample_rate, params)
+            result = (candidates, verify_score, is_valid_point, margin)
+            if is_valid_point:
+                break
+        if result is None:
+            continue
+        candidates, verify_score, is_valid_point, margin = result
+        delay, quality = candidates[0]
+        if is_valid_point and margin < SEARCH_MARGIN:
+            prior_matches += 1
+            misses = 0
+        elif is_valid_point:
+            misses = 0 # Back on track, the prediction is worth trying again
+        elif len(attempts) > 1:
+            misses += 1
+        
+        if previous is None and abs(delay) > params['jump_sec'] * sample_rate:
+            # Large initial offset? Verified with next window
+            print(f"  ? Potential large initial offset {delay/sample_rate:.3f}s. Verifying...")
+            print(f"  ✓ Verified initial offset." if is_valid_point else f"  ✗ Could not verify. Ignoring.")
         
         if is_valid_point:
             raw_points.append((i, delay, quality))
+        
+        positions.append(i)
+        delays.append([c[0] for c in candidates] + [np.nan] * (SCAN_CANDIDATES - len(candidates)))
+        qualities.append([c[1] for c in candidates] + [np.nan] * (SCAN_CANDIDATES - len(candidates)))
+        verify_scores.append(np.nan if verify_score is None else verify_score)
+        used_margins.append(margin / sample_rate)
             
         if i % (STEP_SIZE * 10) == 0:
-            print(f"  Scanned {i/ANALYSIS_RATE:.1f}s...")
-
-    print(f"\nCollected {len(raw_points)} raw points.")
+            print(f"  Scanned {i/sample_rate:.1f}s...")
     
-    if not raw_points:
-        print("No valid synchronization points found.")
-        return
+    if prior is not None:
+        print(f"  Prior: {prior_matches}/{len(positions)} windows matched within +/-{PRIOR_MARGIN_SEC:.1f}s "
+              f"of the last or a predicted delay")
+    
+    scan = {
+        'positions': np.array(positions, dtype=np.int64),
+        'delays': np.array(delays, dtype=np.float64).reshape(-1, SCAN_CANDIDATES),
+        'qualities': np.array(qualities, dtype=np.float32).reshape(-1, SCAN_CANDIDATES),
+        'verify_scores': np.array(verify_scores, dtype=np.float32),
+        'margins': np.array(used_margins, dtype=np.float32),
+        'prior_delays': np.array(prior_delays, dtype=np.float64),
+        'sample_rate': sample_rate,
+        'window_size': WINDOW_SIZE,
+        'clean_length': len(clean),
+        'initial_offset': float(initial_offset),
+    }
+    return raw_points, scan
 
-    # 2. Filter and Smooth Delays
-    # Apply median filter to remove outliers
+def replay_scan(scan, params):
+    """
+    Re-runs the window acceptance over a saved scan with other parameters.
+    A window's delay is only accepted if the scan could have found it from
+    the replayed last delay: within its recorded margin of the last delay
+    (or, for tight margins, of a prior delay), as scan_windows searches.
+    Returns raw_points as (time, delay, quality).
+    """
+    sample_rate = int(scan['sample_rate'])
+    window_size = int(scan['window_size'])
+    margins = scan.get('margins') # Missing in scans saved before margins were recorded
+    prior_delays = list(scan.get('prior_delays', []))
+    raw_points = []
+    for k, pos in enumerate(scan['positions']):
+        delay = float(scan['delays'][k, 0])
+        quality = float(scan['qualities'][k, 0])
+        verify_score = float(scan['verify_scores'][k])
+        if np.isnan(verify_score):
+            verify_score = None
+        previous = raw_points[-1][1] if raw_points else None
+        if margins is not None:
+            last_delay = float(scan['initial_offset']) if previous is None else previous
+            margin = int(round(float(margins[k]) * sample_rate))
+            tight = margin < SCAN_MARGIN_SEC * sample_rate
+            centres = prior_centres(last_delay, prior_delays, margin, SCAN_MARGIN_SEC * sample_rate) if tight else [last_delay]
+            if not reachable(delay, centres, margin, window_size, valid_only=tight):
+                continue
+        if accept_window(delay, quality, verify_score, previous, sample_rate, params):
+            raw_points.append((int(pos), delay, quality))
+    return raw_points
+
+def save_scan(scan_file, scan, clean_file):
+    """Writes the raw scan as a compressed .npz next to the job."""
+    with open(scan_file, 'wb') as f:
+        np.savez_compressed(f, clean_file=np.array(os.path.abspath(clean_file)), **scan)
+    print(f"Scan saved to {scan_file} ({len(scan['positions'])} windows)")
+
+def load_scan(scan_file):
+    """Reads a scan written by save_scan. Returns (scan, clean_file)."""
+    with np.load(scan_file) as data:
+        scan = {key: data[key] for key in data.files}
+    return scan, str(scan.pop('clean_file'))
+
+def filter_delays(raw_points, filter_window):
+    """Median filter over the delays to remove outliers. Returns (time, delay)."""
     filtered_points = []
-    filter_window = 5 # Number of points to consider for median
     
     for k in range(len(raw_points)):
         start_idx = max(0, k - filter_window // 2)
@@ -360,9 +1128,13 @@ def sliding_window_sync(clean_file, reference_file, output_file):
         median_delay = np.median(delays)
         
         filtered_points.append((raw_points[k][0], median_delay))
+    return filtered_points
 
-    # 3. Create Segments
-    # Only create a new segment if the delay changes significantly AND stays changed
+def build_segments(filtered_points, clean_length, sample_rate, change_sec, look_ahead):
+    """
+    Splits the timeline where the delay changes significantly AND stays changed.
+    Returns a list of (start, end, delay) in analysis-rate samples.
+    """
     segments = []
     current_start = 0
     current_delay = filtered_points[0][1]
@@ -372,42 +1144,65 @@ def sliding_window_sync(clean_file, reference_file, output_file):
     for k in range(1, len(filtered_points)):
         time, delay = filtered_points[k]
         
-        # Check for significant change (> 100ms)
-        if abs(delay - current_delay) > (0.1 * ANALYSIS_RATE):
+        # Check for significant change (> 100ms by default)
+        if abs(delay - current_delay) > (change_sec * sample_rate):
             # Delay changed. Is it stable?
             # Look ahead to confirm it's not a blip
             is_stable = True
-            look_ahead = 3
             if k + look_ahead < len(filtered_points):
                 for j in range(1, look_ahead + 1):
-                    if abs(filtered_points[k+j][1] - delay) > (0.1 * ANALYSIS_RATE):
+                    if abs(filtered_points[k+j][1] - delay) > (change_sec * sample_rate):
                         is_stable = False
                         break
             
             if is_stable:
                 # Confirm segment change
                 segments.append((current_start, time, current_delay))
-                print(f"  Segment: {current_start/ANALYSIS_RATE:.1f}s - {time/ANALYSIS_RATE:.1f}s, Delay: {current_delay/ANALYSIS_RATE:.3f}s")
+                print(f"  Segment: {current_start/sample_rate:.1f}s - {time/sample_rate:.1f}s, Delay: {current_delay/sample_rate:.4f}s")
                 
                 current_start = time
                 current_delay = delay
             
     # Final segment
-    segments.append((current_start, len(clean), current_delay))
-    print(f"  Segment: {current_start/ANALYSIS_RATE:.1f}s - {len(clean)/ANALYSIS_RATE:.1f}s, Delay: {current_delay/ANALYSIS_RATE:.3f}s")
+    segments.append((current_start, clean_length, current_delay))
+    print(f"  Segment: {current_start/sample_rate:.1f}s - {clean_length/sample_rate:.1f}s, Delay: {current_delay/sample_rate:.4f}s")
     
     print(f"\n{'='*60}")
     print(f"SUMMARY:")
     print(f"  Total segments: {len(segments)}")
     print(f"{'='*60}\n")
-    
-    # Reconstruct
-    clean_channels, clean_rate = get_audio_info(clean_file)
-    print(f"Loading full quality clean audio ({clean_rate}Hz, {clean_channels}ch)...")
-    clean_hq = get_audio_data(clean_file, clean_rate, clean_channels)
+    return segments
+
+def fit_scan_model(filtered_points, window_size, sample_rate, model_file):
+    """
+    Fits a constant/linear model to the filtered delays and writes it to
+    model_file. Returns the model if it fits (no WAV needs rendering), else None.
+    """
+    # Window delays belong to the window centre
+    model = fit_delay_model([(t + window_size / 2, d) for t, d in filtered_points], sample_rate)
+    if model:
+        print(f"\nDelay map fits a {model['model']} model: delay {model['delay_ms']:.1f}ms, "
+              f"factor {model['factor']:.8f} (max residual {model['max_residual_ms']:.1f}ms)")
+        print("Skipping audio reconstruction.\n")
+        write_model(model_file, model)
+        return model
+    print("\nDelay map does not fit a constant or linear model. Reconstructing audio.")
+    return None
+
+def render_segments(clean_file, segments, clean_length, analysis_rate, output_file, hq=None):
+    """
+    Rebuilds the clean audio at full quality with each segment shifted by its delay.
+    hq is an HQPrefetch already decoding clean_file; without it the audio is decoded here.
+    """
+    if hq is not None:
+        clean_hq, clean_channels, clean_rate = hq.result()
+    else:
+        clean_channels, clean_rate = get_audio_info(clean_file)
+        print(f"Loading full quality clean audio ({clean_rate}Hz, {clean_channels}ch)...")
+        clean_hq = get_audio_data(clean_file, clean_rate, clean_channels)
     
     final_delay = segments[-1][2] if segments else 0
-    output_len = int((len(clean) + final_delay) * (clean_rate / ANALYSIS_RATE))
+    output_len = int((clean_length + final_delay) * (clean_rate / analysis_rate))
     
     if clean_channels > 1:
         output = np.zeros((output_len, clean_channels), dtype=np.int16)
@@ -417,9 +1212,9 @@ def sliding_window_sync(clean_file, reference_file, output_file):
     print("\nReconstructing...\n")
     
     for idx, (start, end, delay) in enumerate(segments):
-        hq_start = int(start * (clean_rate / ANALYSIS_RATE))
-        hq_end = int(end * (clean_rate / ANALYSIS_RATE))
-        hq_delay = int(delay * (clean_rate / ANALYSIS_RATE))
+        hq_start = int(start * (clean_rate / analysis_rate))
+        hq_end = int(end * (clean_rate / analysis_rate))
+        hq_delay = int(round(delay * (clean_rate / analysis_rate)))
         
         hq_len = hq_end - hq_start
         dst_start = hq_start + hq_delay
@@ -442,13 +1237,386 @@ def sliding_window_sync(clean_file, reference_file, output_file):
     save_wav(output, clean_rate, clean_channels, output_file)
     print("Done!\n")
 
+PREVIEW_CLIP_SEC = 20
+PREVIEW_MAX_CLIPS = 6
+
+def model_segments(model, clean_length, sample_rate, step_sec=10):
+    """
+    Turns a fitted delay model into (start, end, delay) segments. A linear
+    drift is approximated by a constant delay per step_sec piece.
+    """
+    intercept = model['delay_ms'] / 1000 * sample_rate
+    slope = model['factor'] - 1.0
+    if slope == 0:
+        return [(0, clean_length, intercept)]
+    step = int(step_sec * sample_rate)
+    return [(start, min(start + step, clean_length), intercept + slope * (start + min(step, clean_length - start) / 2))
+            for start in range(0, clean_length, step)]
+
+def choose_preview_times(segments, clean_length, sample_rate, clip_sec=PREVIEW_CLIP_SEC, max_clips=PREVIEW_MAX_CLIPS,
+                         change_sec=SEGMENT_DEFAULTS['change_sec']):
+    """
+    Picks clip start times (seconds, target timeline): one clip near the end
+    (where a drift is largest), one centred on each boundary where the delay
+    changes by more than change_sec (largest changes first), topped up with
+    clips spread over the title. Clips are at least clip_sec apart.
+    """
+    duration = (clean_length + segments[-1][2]) / sample_rate
+    latest = max(0.0, duration - clip_sec)
+    
+    # Boundaries with a real delay change. Drift models and silence splits
+    # also produce boundaries where the delay barely moves.
+    changes = []
+    for (_, _, previous), (start, _, delay) in zip(segments, segments[1:]):
+        if abs(delay - previous) > change_sec * sample_rate:
+            t = min(latest, max(0.0, (start + delay) / sample_rate - clip_sec / 2))
+            changes.append((abs(delay - previous), t))
+    changes.sort(key=lambda c: -c[0])
+    
+    times = [latest]
+    for _, candidate in changes:
+        if len(times) >= max_clips:
+            break
+        if all(abs(candidate - t) >= clip_sec for t in times):
+            times.append(candidate)
+    for fraction in (0.5, 0.25, 0.75, 0.1, 0.9, 0.0):
+        if len(times) >= min(3, max_clips):
+            break
+        candidate = latest * fraction
+        if all(abs(candidate - t) >= clip_sec for t in times):
+            times.append(candidate)
+    return sorted(times)
+
+def render_preview_clips(clean_file, segments, clean_length, analysis_rate, preview_dir, times=None,
+                         clip_sec=PREVIEW_CLIP_SEC):
+    """
+    Renders short synced clips instead of the whole title, decoding only the
+    source ranges each clip needs. Writes clip_NN.wav files and preview.json
+    ({clip_sec, segments, clips: [{wav, start, delay}]}, seconds) to
+    preview_dir for the caller to mux with slices of the target video.
+    """
+    os.makedirs(preview_dir, exist_ok=True)
+    if times is None:
+        times = choose_preview_times(segments, clean_length, analysis_rate, clip_sec)
+    clean_channels, clean_rate = get_audio_info(clean_file)
+    
+    print(f"Rendering {len(times)} preview clip(s) of {clip_sec}s...")
+    clips = []
+    for n, t0 in enumerate(times, 1):
+        # Parts of the clip covered by each segment: (target start, target end, delay), seconds
+        pieces = []
+        for start, end, delay in segments:
+            a = max(t0, (start + delay) / analysis_rate)
+            b = min(t0 + clip_sec, (end + delay) / analysis_rate)
+            if b > a:
+                pieces.append((a, b, delay / analysis_rate))
+        if not pieces:
+            print(f"  Clip at {t0:.1f}s: no audio mapped there, skipped.")
+            continue
+        
+        src_start = max(0.0, min(a - d for a, b, d in pieces))
+        src_end = max(b - d for a, b, d in pieces)
+        clean_hq = get_audio_data(clean_file, clean_rate, clean_channels,
+                                  start_sec=src_start, duration_sec=src_end - src_start)
+        
+        clip_len = int(clip_sec * clean_rate)
+        if clean_channels > 1:
+            output = np.zeros((clip_len, clean_channels), dtype=np.int16)
+        else:
+            output = np.zeros(clip_len, dtype=np.int16)
+        
+        for a, b, d in pieces:
+            dst_start = int(round((a - t0) * clean_rate))
+            hq_start = int(round((a - d - src_start) * clean_rate))
+            hq_len = int(round((b - a) * clean_rate))
+            
+            if hq_start < 0:
+                hq_len += hq_start
+                dst_start -= hq_start
+                hq_start = 0
+            hq_len = min(hq_len, len(clean_hq) - hq_start, len(output) - dst_start)
+            
+            if hq_len > 0:
+                output[dst_start:dst_start + hq_len] = clean_hq[hq_start:hq_start + hq_len]
+        
+        wav_name = f"clip_{n:02d}.wav"
+        save_wav(output, clean_rate, clean_channels, os.path.join(preview_dir, wav_name))
+        centre_delay = min(pieces, key=lambda p: abs((p[0] + p[1]) / 2 - (t0 + clip_sec / 2)))[2]
+        clips.append({'wav': wav_name, 'start': t0, 'delay': centre_delay})
+        print(f"  Clip {n}: {t0:.1f}s - {t0 + clip_sec:.1f}s, Delay: {centre_delay:.4f}s")
+    
+    with open(os.path.join(preview_dir, 'preview.json'), 'w') as f:
+        json.dump({
+            'clip_sec': clip_sec,
+            'segments': [{'start': s / analysis_rate, 'end': e / analysis_rate, 'delay': d / analysis_rate}
+                         for s, e, d in segments],
+            'clips': clips,
+        }, f, indent=2)
+    print(f"Preview written to {preview_dir}\n")
+    return clips
+
+def sliding_window_sync(clean_file, reference_file, output_file, analysis_rate=DEFAULT_ANALYSIS_RATE, global_search=True,
+                        ref_stream='auto', model_file=None, preloaded=None, initial_offset=None, scan_file=None,
+                        preview_dir=None, decoders=None, hq=None, prior=None, delay_map_file=None, scan_audio=None):
+    """
+    Continuous synchronization using sliding window cross-correlation.
+    Scans the entire audio in steps, calculating delay at each point.
+    Delays are kept in (fractional) analysis-rate samples.
+    If global_search is set, the scan starts from a blockwise global offset
+    estimate instead of 0.
+    ref_stream selects the reference audio stream to decode: 'auto' picks the
+    cheapest suitable one, None lets ffmpeg choose, an int forces 0:<index>.
+    If model_file is set and the delays fit a constant or linear model, the
+    model is written there as JSON and no WAV is rendered, so the caller can
+    mux the original bitstream with mkvmerge --sync instead.
+    preloaded (clean, ref) and initial_offset skip decoding and the global
+    estimate when the caller already has them.
+    If scan_file is set, the raw per-window results are saved there so
+    resegment() can re-tune the post-processing without rescanning. The scan
+    names scan_audio (default: clean_file) as the audio to render from, for
+    callers that move the clean audio next to the scan afterwards.
+    If preview_dir is set, only short preview clips are rendered there
+    (see render_preview_clips) instead of the full WAV or model.
+    decoders is a DecodePool to decode on. With one, the full-quality decode
+    for reconstruction starts in the background while the scan runs when a
+    render is certain (no model_file), otherwise once the delays turned out
+    not to fit a model. A caller that already started it passes the
+    HQPrefetch as hq.
+    prior (see load_prior) seeds the initial offset and narrows the search
+    around predicted delays; delay_map_file receives the final delay map.
+    """
+    ANALYSIS_RATE = analysis_rate
+    params = SEGMENT_DEFAULTS
+    
+    print("=== Continuous Sliding Window Synchronization ===\n")
+    print(f"Analysis rate: {ANALYSIS_RATE} Hz\n")
+    
+    # Load audios
+    if preloaded is not None:
+        clean, ref = preloaded
+    else:
+        clean, ref = load_analysis_audio(clean_file, reference_file, ANALYSIS_RATE, ref_stream, decoders)
+    
+    if hq is None and decoders is not None and not preview_dir and not model_file:
+        hq = decoders.prefetch_hq(clean_file)
+    
+    # 1. Collect delay points
+    print("Scanning audio with sliding window...")
+    
+    # The scan only searches +/- SEARCH_MARGIN around the last delay, so seed it
+    # with a global estimate to handle large initial offsets.
+    if initial_offset is None:
+        initial_offset = find_start_offset(clean, ref, ANALYSIS_RATE, global_search, prior)
+    
+    raw_points, scan = scan_windows(clean, ref, ANALYSIS_RATE, initial_offset, params, prior)
+    if scan_file:
+        save_scan(scan_file, scan, scan_audio or clean_file)
+
+    print(f"\nCollected {len(raw_points)} raw points.")
+    
+    if not raw_points:
+        print("No valid synchronization points found.")
+        if hq is not None:
+            hq.discard()
+        return
+
+    # 2. Filter and Smooth Delays
+    filtered_points = filter_delays(raw_points, params['filter_window'])
+
+    model = None
+    if model_file and not preview_dir:
+        model = fit_scan_model(filtered_points, scan['window_size'], ANALYSIS_RATE, model_file)
+    if model:
+        if hq is not None:
+            hq.discard() # Muxed with --sync, no reconstruction needed
+        if delay_map_file:
+            write_delay_map(delay_map_file, model_segments(model, len(clean), ANALYSIS_RATE), ANALYSIS_RATE)
+        return
+
+    # 3. Create Segments
+    segments = build_segments(filtered_points, len(clean), ANALYSIS_RATE, params['change_sec'], params['look_ahead'])
+    if delay_map_file:
+        write_delay_map(delay_map_file, segments, ANALYSIS_RATE)
+    
+    # Reconstruct
+    if preview_dir:
+        render_preview_clips(clean_file, segments, len(clean), ANALYSIS_RATE, preview_dir)
+    else:
+        if hq is None and decoders is not None:
+            hq = decoders.prefetch_hq(clean_file)
+        render_segments(clean_file, segments, len(clean), ANALYSIS_RATE, output_file, hq)
+        if hq is not None:
+            hq.discard()
+
+def resegment(scan_file, output_file=None, model_file=None, preview_dir=None, clean_file=None, **overrides):
+    """
+    Rebuilds points and segments from a saved scan with new post-processing
+    parameters (see SEGMENT_DEFAULTS) in milliseconds, without decoding or
+    correlating again. Renders the WAV only if output_file is given, and
+    preview clips only if preview_dir is given, from clean_file if set or
+    else the clean audio recorded in the scan.
+    Returns the segments as (start, end, delay) in analysis-rate samples, or
+    None if model_file is set and the delays fit a constant/linear model.
+    """
+    params = {**SEGMENT_DEFAULTS, **{k: v for k, v in overrides.items() if v is not None}}
+    scan, scan_audio = load_scan(scan_file)
+    clean_file = clean_file or scan_audio
+    sample_rate = int(scan['sample_rate'])
+    clean_length = int(scan['clean_length'])
+    
+    print(f"Re-segmenting {len(scan['positions'])} windows with {params}")
+    raw_points = replay_scan(scan, params)
+    print(f"Collected {len(raw_points)} raw points.")
+    if not raw_points:
+        print("No valid synchronization points found.")
+        return []
+    
+    filtered_points = filter_delays(raw_points, params['filter_window'])
+    if model_file and fit_scan_model(filtered_points, int(scan['window_size']), sample_rate, model_file):
+        return None
+    
+    segments = build_segments(filtered_points, clean_length, sample_rate, params['change_sec'], params['look_ahead'])
+    if output_file:
+        render_segments(clean_file, segments, clean_length, sample_rate, output_file)
+    if preview_dir:
+        render_preview_clips(clean_file, segments, clean_length, sample_rate, preview_dir)
+    return segments
+
+def planned_sync(clean_file, reference_file, output_file, analysis_rate=DEFAULT_ANALYSIS_RATE, global_search=True,
+                 ref_stream='auto', model_file=None, scan_file=None, preview_dir=None, decoders=None,
+                 prior=None, delay_map_file=None, scan_audio=None):
+    """
+    Probes the job first and dispatches to the cheapest engine that can handle it:
+    constant/linear delays are written as a model (no scan, no render), small
+    discrete cuts at silences go to the silence-split smart_synchronize,
+    everything else to the dense sliding window scan. The decision is printed
+    to the job log. If the smart_synchronize delay map disagrees with the
+    probes, the job falls back to the dense scan before rendering.
+    With preview_dir, every engine renders preview clips instead.
+    With a decoders pool, the full-quality decode starts as soon as the plan
+    shows a render is needed and overlaps the segment matching or scan.
+    With a prior (see load_prior) the offset search and the probes start
+    around the delays of earlier episodes with a tight margin, and only
+    widen when they do not match. delay_map_file receives the final delay map.
+    Only the dense engine writes scan_file.
+    """
+    clean, ref = load_analysis_audio(clean_file, reference_file, analysis_rate, ref_stream, decoders)
+    initial_offset = find_start_offset(clean, ref, analysis_rate, global_search, prior)
+    
+    print("=== Planning ===")
+    plan = None
+    if prior is not None:
+        # Probe only as wide as the delays the series has shown
+        spread = max(abs(d - initial_offset) for d in prior['delays']) / analysis_rate
+        plan = plan_sync(clean, ref, analysis_rate, initial_offset, margin_sec=min(30, spread + 2))
+        if plan['class'] == 'unreliable':
+            print("  Probes did not match around the prior. Widening.")
+            plan = None
+    if plan is None:
+        plan = plan_sync(clean, ref, analysis_rate, initial_offset)
+    engine = plan['engine']
+    if engine == 'model' and not model_file and not preview_dir:
+        engine = 'dense' # The caller needs a rendered WAV
+    
+    print(f"PLAN: class={plan['class']}, engine={engine}, cuts={plan['cuts']}")
+    if engine == 'model':
+        if scan_file:
+            print(f"  No dense scan with the model engine, {scan_file} is not written.")
+        model = plan['model']
+        print(f"  {model['model']} delay {model['delay_ms']:.1f}ms, factor {model['factor']:.8f} "
+              f"(max residual {model['max_residual_ms']:.1f}ms)\n")
+        segments = model_segments(model, len(clean), analysis_rate)
+        if preview_dir:
+            render_preview_clips(clean_file, segments, len(clean), analysis_rate, preview_dir)
+        else:
+            write_model(model_file, model)
+        if delay_map_file:
+            write_delay_map(delay_map_file, segments, analysis_rate)
+        return plan
+    
+    if engine == 'segments':
+        from smart_synchronize import smart_synchronize, render_synchronized
+        hq = decoders.prefetch_hq(clean_file) if decoders is not None and not preview_dir else None
+        segments = smart_synchronize(clean_file, reference_file, None, segment_splits(plan['cuts']), analysis_rate,
+                                     parallel=True, preloaded=(clean, ref), initial_offset=initial_offset)
+        if segments_match_probes(segments, clean, ref, plan['probes'], plan['probe_len'], analysis_rate):
+            if scan_file:
+                print(f"  No dense scan with the segments engine, {scan_file} is not written.")
+            if preview_dir:
+                render_preview_clips(clean_file, segments, len(clean), analysis_rate, preview_dir)
+            else:
+                render_synchronized(clean_file, segments, len(clean), len(ref), analysis_rate, output_file, hq)
+            if hq is not None:
+                hq.discard()
+            if delay_map_file:
+                write_delay_map(delay_map_file, segments, analysis_rate)
+            return plan
+        print("PLAN: segment delays do not match the probes, falling back to engine=dense")
+        plan['engine'] = 'dense'
+    else:
+        hq = None
+    
+    # The probes ruled out a constant/linear map, so a render is all but
+    # certain: decode the full-quality audio while the scan runs
+    if hq is None and decoders is not None and not preview_dir:
+        hq = decoders.prefetch_hq(clean_file)
+    sliding_window_sync(clean_file, reference_file, output_file, analysis_rate, global_search,
+                        ref_stream, model_file, preloaded=(clean, ref), initial_offset=initial_offset,
+                        scan_file=scan_file, preview_dir=preview_dir, decoders=decoders, hq=hq, prior=prior,
+                        delay_map_file=delay_map_file, scan_audio=scan_audio)
+    return plan
+
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: python adaptive_sync.py <clean_audio> <reference_video> <output_wav>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Continuous sliding window audio synchronization.")
+    parser.add_argument('clean_file', help="Clean source audio")
+    parser.add_argument('reference_file', help="Reference video/audio")
+    parser.add_argument('output_file', help="Output WAV")
+    parser.add_argument('--rate', type=int, default=DEFAULT_ANALYSIS_RATE,
+                        help=f"Analysis sample rate in Hz (default: {DEFAULT_ANALYSIS_RATE})")
+    parser.add_argument('--no-global-search', dest='global_search', action='store_false',
+                        help="Start the scan around 0 instead of estimating a global offset")
+    parser.add_argument('--model-out',
+                        help="If the delays fit a constant/linear model, write it to this JSON file and skip the WAV")
+    parser.add_argument('--engine', choices=['auto', 'dense'], default='dense',
+                        help="'auto' probes the job first and picks the cheapest engine; 'dense' always scans")
+    parser.add_argument('--ref-stream', default='auto',
+                        help="Reference audio stream index to decode, 'auto' (cheapest suitable) or 'default' (ffmpeg's choice)")
+    parser.add_argument('--scan-out',
+                        help="Save the raw dense scan (.npz) here for re-tuning with resegment.py "
+                             "(only written when the dense engine runs)")
+    parser.add_argument('--scan-audio',
+                        help="Clean audio path recorded in the scan for resegment.py to render from "
+                             "(default: clean_file), if the caller keeps it elsewhere")
+    parser.add_argument('--preview',
+                        help="Render short preview clips and preview.json to this folder instead of the full WAV")
+    parser.add_argument('--max-decoders', type=int, default=DEFAULT_MAX_DECODERS,
+                        help=f"Maximum ffmpeg decoders running at once (default: {DEFAULT_MAX_DECODERS})")
+    parser.add_argument('--hq-temp',
+                        help="Raw file for the background full-quality decode (default: a new file in the system temp dir)")
+    parser.add_argument('--prior',
+                        help="JSON with delay maps of earlier episodes of the series, used to narrow the search")
+    parser.add_argument('--delay-map-out',
+                        help="Write the final delay map (segments in seconds) to this JSON file")
+    args = parser.parse_args()
     
-    clean_file = sys.argv[1]
-    reference_file = sys.argv[2]
-    output_file = sys.argv[3]
+    if args.ref_stream == 'default':
+        args.ref_stream = None
+    elif args.ref_stream != 'auto':
+        args.ref_stream = int(args.ref_stream)
     
-    sliding_window_sync(clean_file, reference_file, output_file)
+    prior = load_prior(args.prior, args.rate) if args.prior else None
+    
+    install_cancel_handlers()
+    decoders = DecodePool(args.max_decoders, args.hq_temp)
+    try:
+        sync = planned_sync if args.engine == 'auto' else sliding_window_sync
+        sync(args.clean_file, args.reference_file, args.output_file, args.rate, args.global_search,
+             args.ref_stream, args.model_out, scan_file=args.scan_out, preview_dir=args.preview, decoders=decoders,
+             prior=prior, delay_map_file=args.delay_map_out, scan_audio=args.scan_audio)
+    except SyncCancelled:
+        print("Cancelled. Stopping decoders and removing partial output...")
+        _temp_files.add(args.output_file)
+        sys.exit(130)
+    finally:
+        release_resources()
+        decoders.shutdown()
@@ -4,10 +4,17 @@ const fs = require('fs');
 const { execFile } = require('child_process');
 const { getMkvFiles } = require('./lib/utils');
 const { getMediaInfo, convertFps, extractAudioTrack, cleanAudio, encodeAudio } = require('./lib/ffmpeg');
-const { getMkvInfo, mergeFiles } = require('./lib/mkv');
+const { getMkvInfo, mergeFiles, formatSyncOption } = require('./lib/mkv');
+
+// Optional analysis sample rate: node cli.js --rate 4000
+function parseRate(argv) {
+    const i = argv.indexOf('--rate');
+    return i >= 0 ? parseInt(argv[i + 1]) : null;
+}
 
 async function main() {
     console.log('=== MKV Audio Sync CLI ===');
+    const analysisRate = parseRate(process.argv.slice(2));
 
     const mkvFiles = getMkvFiles(process.cwd());
     const inputDir = path.join(process.cwd(), 'inputs');
@@ -118,32 +125,57 @@ async function main() {
     // Smart Synchronization
     console.log('\nCalculating sync offset and generating synchronized audio...');
     const syncedWav = path.join(outputDir, 'synced_audio.wav');
+    const modelFile = path.join(outputDir, 'sync_model.json');
+    if (fs.existsSync(modelFile)) fs.unlinkSync(modelFile);
+
+    // The dense scan is kept for resegment.py, with the audio it renders from
+    // when that audio is one of our temporary files
+    const scanFile = path.join(outputDir, 'sync_scan.npz');
+    const audioIsTemp = audioSourceForSync === audioClean || audioSourceForSync.includes('converted_temp.mkv');
+    const scanAudio = audioIsTemp ? path.join(outputDir, 'sync_scan_audio' + path.extname(audioSourceForSync)) : null;
+    for (const file of [scanFile, scanAudio]) {
+        if (file && fs.existsSync(file)) fs.unlinkSync(file);
+    }
 
     try {
-        await smartSynchronize(audioSourceForSync, answers.targetFile, syncedWav);
+        // Direct muxing needs the single-track cleaned audio
+        const useModel = audioSourceForSync === audioClean;
+        await smartSynchronize(audioSourceForSync, answers.targetFile, syncedWav, useModel ? modelFile : null,
+            scanFile, scanAudio, analysisRate);
         console.log('✅ Synchronized audio generated.');
     } catch (e) {
         console.error('❌ Synchronization failed:', e);
         return;
     }
 
+    // Constant/linear delay maps are applied by mkvmerge without re-encoding
+    let syncModel = null;
+    if (fs.existsSync(modelFile)) {
+        syncModel = JSON.parse(fs.readFileSync(modelFile, 'utf8'));
+    }
+
     // Encode to AC3 (or match source?)
     // For now let's stick to AC3 192k as per previous logic
-    const finalAudio = path.join(outputDir, 'synced_audio.ac3');
-    try {
-        await encodeAudio(syncedWav, finalAudio, 'ac3', 192);
-        console.log('✅ Audio encoded to AC3.');
-    } catch (e) {
-        console.error('❌ Encoding failed:', e);
-        return;
+    let finalAudio = path.join(outputDir, 'synced_audio.ac3');
+    if (syncModel) {
+        console.log(`✅ Delay map is ${syncModel.model}, skipping re-encode.`);
+        finalAudio = audioSourceForSync;
+    } else {
+        try {
+            await encodeAudio(syncedWav, finalAudio, 'ac3', 192);
+            console.log('✅ Audio encoded to AC3.');
+        } catch (e) {
+            console.error('❌ Encoding failed:', e);
+            return;
+        }
     }
 
     // Final Merge
     const finalOutput = path.join(outputDir, 'synced_output.mkv');
     console.log(`\nMerging into ${finalOutput}...`);
 
-    // No delay needed as audio is already synced
-    const delay = 0;
+    // No delay needed if the audio was rebuilt already synced
+    const syncOption = syncModel ? formatSyncOption(0, syncModel) : '0:0';
 
     // Metadata extraction from original source
     let audioMetadata = {
@@ -172,7 +204,7 @@ async function main() {
         {
             path: finalAudio,
             options: [
-                '--sync', `0:${delay}`,
+                '--sync', syncOption,
                 '--language', `0:${audioMetadata.language}`,
                 '--track-name', `0:${audioMetadata.title}`,
                 '--default-track', '0:yes'
@@ -190,13 +222,19 @@ async function main() {
         await mergeFiles(finalOutput, inputs);
         console.log('Merge successful!');
 
+        if (scanAudio && fs.existsSync(scanFile)) {
+            fs.renameSync(audioSourceForSync, scanAudio);
+            console.log(`Scan kept for resegment.py: ${scanFile}`);
+        }
+
         // Clean up temporary files
         console.log('\nCleaning up temporary files...');
         const tempFiles = [
             audioRaw,              // audio_extracted.ac3
             audioClean,            // audio_clean.ac3
             syncedWav,             // synced_audio.wav
-            finalAudio             // synced_audio.ac3
+            path.join(outputDir, 'synced_audio.ac3'),
+            modelFile              // sync_model.json
         ];
 
         // Add converted file if it was created
@@ -223,11 +261,16 @@ async function main() {
     }
 }
 
-function smartSynchronize(sourceFile, referenceFile, outputFile) {
+function smartSynchronize(sourceFile, referenceFile, outputFile, modelFile, scanFile, scanAudio, analysisRate) {
     return new Promise((resolve, reject) => {
         const scriptPath = path.join(__dirname, 'adaptive_sync.py');
         console.log('Running adaptive synchronization...');
-        execFile('python', [scriptPath, sourceFile, referenceFile, outputFile], (error, stdout, stderr) => {
+        const args = [scriptPath, sourceFile, referenceFile, outputFile, '--engine', 'auto'];
+        if (modelFile) args.push('--model-out', modelFile);
+        if (scanFile) args.push('--scan-out', scanFile); // Kept for resegment.py
+        if (scanAudio) args.push('--scan-audio', scanAudio);
+        if (analysisRate) args.push('--rate', String(analysisRate));
+        execFile('python', args, (error, stdout, stderr) => {
             if (error) {
                 console.error(stdout); // Python script prints to stdout
                 reject(error);
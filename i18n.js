@@ -25,6 +25,7 @@ const translations = {
         cancelOp: 'Cancel Operation',
         cancelling: 'Cancelling...',
         openOutputFolder: 'Open Output Folder',
+        previewSync: 'Preview Sync',
 
         // Progress
         ready: 'Ready',
@@ -78,6 +79,7 @@ const translations = {
         cancelOp: 'Cancelar Operación',
         cancelling: 'Cancelando...',
         openOutputFolder: 'Abrir Carpeta de Salida',
+        previewSync: 'Vista Previa',
 
         // Progress
         ready: 'Listo',
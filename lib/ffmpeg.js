@@ -1,10 +1,10 @@
 const ffmpeg = require('ffmpeg-static');
-const { execFile } = require('child_process');
 const path = require('path');
+const { execFileTree } = require('./supervisor');
 
 function runCommand(args, onStart) {
     return new Promise((resolve, reject) => {
-        const child = execFile(ffmpeg, args, (error, stdout, stderr) => {
+        const child = execFileTree(ffmpeg, args, { supervised: Boolean(onStart) }, (error, stdout, stderr) => {
             if (error) {
                 // Include stderr in rejection so we can still parse ffmpeg info
                 reject({ error, stderr, stdout });
@@ -92,7 +92,7 @@ function convertFps(input, output, targetFps, onProgress, onStart) {
     ];
 
     return new Promise((resolve, reject) => {
-        const child = execFile(ffmpeg, args, (error, stdout, stderr) => {
+        const child = execFileTree(ffmpeg, args, { supervised: Boolean(onStart) }, (error, stdout, stderr) => {
             if (error) {
                 reject({ error, stderr, stdout });
             } else {
@@ -175,7 +175,7 @@ function extractAudioTrack(inputFile, trackIndex, outputFile, onStart) {
             if (!error) {
                 // mkvextract is available, use it
                 console.log(`🎵 Extrayendo audio con mkvextract (track ${trackIndex})...`);
-                const child = exec(mkvExtractCmd, (extractError, stdout, stderr) => {
+                const child = execFileTree(mkvExtractCmd, [], { shell: true, supervised: Boolean(onStart) }, (extractError, stdout, stderr) => {
                     if (extractError) {
                         console.log('⚠️  mkvextract falló, intentando con ffmpeg...');
                         extractWithFFmpeg(inputFile, trackIndex, outputFile, onStart)
@@ -236,7 +236,7 @@ function cleanAudio(inputAudio, outputAudio, bitrate = 192, onProgress, onStart)
     ];
 
     return new Promise((resolve, reject) => {
-        const child = execFile(ffmpeg, args, (error, stdout, stderr) => {
+        const child = execFileTree(ffmpeg, args, { supervised: Boolean(onStart) }, (error, stdout, stderr) => {
             if (error) {
                 reject({ error, stderr, stdout });
             } else {
@@ -286,8 +286,9 @@ function mergeFiles(inputAudio, inputVideo, output, delay, audioTrackIndex) {
  * @param {string} output - Output audio file
  * @param {string} codec - Audio codec (e.g., ac3, aac)
  * @param {number} bitrate - Bitrate in kbps
+ * @param {function} onStart - Receives the child process
  */
-function encodeAudio(input, output, codec = 'ac3', bitrate = 192) {
+function encodeAudio(input, output, codec = 'ac3', bitrate = 192, onStart) {
     console.log(`🎵 Encoding audio to ${codec} (${bitrate}k)...`);
     const args = [
         '-i', input,
@@ -296,7 +297,43 @@ function encodeAudio(input, output, codec = 'ac3', bitrate = 192) {
         '-y',
         output
     ];
-    return runCommand(args);
+    return runCommand(args, onStart);
+}
+
+/**
+ * Muxes a short audio clip with the matching slice of a video for a quick
+ * sync preview. The video slice is re-encoded (small, fast H.264) so it
+ * starts exactly at `start`: a stream copy starts at the previous keyframe,
+ * up to a GOP before the audio, which shows as a false offset. H.264 also
+ * plays in <video> where VC-1/MPEG-2 targets would not.
+ * @param {string} videoFile - Video provider
+ * @param {string} audioFile - Synced audio clip (wav)
+ * @param {number} start - Slice start in seconds
+ * @param {number} duration - Slice length in seconds
+ * @param {string} output - Output clip (mp4)
+ * @param {function} onStart - Receives the child process
+ */
+function muxPreviewClip(videoFile, audioFile, start, duration, output, onStart) {
+    const args = [
+        '-ss', start.toFixed(3),
+        '-t', duration.toFixed(3),
+        '-i', videoFile,
+        '-i', audioFile,
+        '-map', '0:v:0',
+        '-map', '1:a:0',
+        '-vf', "scale='min(854,iw)':-2",
+        '-c:v', 'libx264',
+        '-preset', 'ultrafast',
+        '-crf', '30',
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        '-b:a', '192k',
+        '-shortest',
+        '-movflags', '+faststart',
+        '-y',
+        output
+    ];
+    return runCommand(args, onStart);
 }
 
 module.exports = {
@@ -305,5 +342,6 @@ module.exports = {
     extractAudioTrack,
     cleanAudio,
     mergeFiles,
-    encodeAudio
+    encodeAudio,
+    muxPreviewClip
 };
@@ -0,0 +1,110 @@
+/**
+ * Coalescing log/progress channel between the main process and the renderer.
+ *
+ * Log lines are queued and flushed in batches at a fixed frame rate, and the
+ * most recent lines are kept in a bounded ring buffer so the renderer can
+ * lazily fetch older history. Progress updates are merged per job: only the
+ * latest update of each job is sent on every frame.
+ */
+class LogBus {
+    /**
+     * @param {Object} options
+     * @param {function(string, any)} options.send - Sends a message to the renderer (channel, payload)
+     * @param {number} [options.fps=10] - Flush rate in frames per second
+     * @param {number} [options.capacity=5000] - Number of lines kept in the ring buffer
+     */
+    constructor({ send, fps = 10, capacity = 5000 }) {
+        this.send = send;
+        this.interval = Math.max(1, Math.round(1000 / fps));
+        this.capacity = capacity;
+
+        this.ring = new Array(capacity);
+        this.nextSeq = 0; // Sequence number of the next line
+        this.pendingLogs = [];
+        this.pendingProgress = new Map(); // jobId -> { jobId, percent, text }
+        this.timer = null;
+    }
+
+    /**
+     * Queues a log message. Multi-line messages are split into lines.
+     * @param {string} message
+     * @param {string} type - info, success, warning or error
+     */
+    log(message, type = 'info') {
+        const time = Date.now();
+        const lines = String(message).split(/\r?\n/);
+        // Drop the trailing empty line of outputs that end with a newline
+        if (lines.length > 1 && lines[lines.length - 1] === '') lines.pop();
+
+        for (const line of lines) {
+            const entry = { seq: this.nextSeq++, time, message: line, type };
+            this.ring[entry.seq % this.capacity] = entry;
+            this.pendingLogs.push(entry);
+        }
+
+        // Never let the pending queue grow beyond what the ring can serve
+        if (this.pendingLogs.length > this.capacity) {
+            this.pendingLogs.splice(0, this.pendingLogs.length - this.capacity);
+        }
+        this.schedule();
+    }
+
+    /**
+     * Queues a progress update. Only the latest update per job is sent.
+     * @param {number} percent - 0-100, or -1 for indeterminate
+     * @param {string} text
+     * @param {string} jobId
+     */
+    progress(percent, text = '', jobId = 'main') {
+        this.pendingProgress.set(jobId, { jobId, percent, text });
+        this.schedule();
+    }
+
+    /**
+     * Returns up to `limit` lines older than `beforeSeq` (oldest first).
+     * @param {number} [beforeSeq] - Defaults to the newest line
+     * @param {number} [limit=200]
+     */
+    getHistory(beforeSeq = this.nextSeq, limit = 200) {
+        const oldest = Math.max(0, this.nextSeq - this.capacity);
+        const end = Math.min(beforeSeq, this.nextSeq);
+        const start = Math.max(oldest, end - limit);
+
+        const entries = [];
+        for (let seq = start; seq < end; seq++) {
+            entries.push(this.ring[seq % this.capacity]);
+        }
+        return { entries, hasMore: start > oldest };
+    }
+
+    schedule() {
+        if (this.timer) return;
+        this.timer = setTimeout(() => this.flush(), this.interval);
+        if (this.timer.unref) this.timer.unref();
+    }
+
+    /**
+     * Sends all pending logs and progress updates immediately.
+     */
+    flush() {
+        if (this.timer) {
+            clearTimeout(this.timer);
+            this.timer = null;
+        }
+
+        if (this.pendingLogs.length > 0) {
+            const entries = this.pendingLogs;
+            this.pendingLogs = [];
+            this.send('log-batch', entries);
+        }
+
+        for (const update of this.pendingProgress.values()) {
+            this.send('progress', update);
+        }
+        this.pendingProgress.clear();
+    }
+}
+
+module.exports = {
+    LogBus
+};
@@ -1,13 +1,14 @@
-const { execFile } = require('child_process');
+const { execFileTree } = require('./supervisor');
 
 /**
  * Executes mkvmerge with the given arguments
  * @param {string[]} args - Arguments for mkvmerge
+ * @param {function} onStart - Receives the child process
  * @returns {Promise<{stdout: string, stderr: string}>}
  */
-function runMkvMerge(args) {
+function runMkvMerge(args, onStart) {
     return new Promise((resolve, reject) => {
-        execFile('mkvmerge', args, (error, stdout, stderr) => {
+        const child = execFileTree('mkvmerge', args, { supervised: Boolean(onStart) }, (error, stdout, stderr) => {
             if (error) {
                 // mkvmerge returns exit code 1 for warnings, 2 for errors
                 // We should check stderr/stdout to decide if it's a real failure
@@ -21,6 +22,8 @@ function runMkvMerge(args) {
                 resolve({ stdout, stderr });
             }
         });
+
+        if (onStart) onStart(child);
     });
 }
 
@@ -43,8 +46,9 @@ async function getMkvInfo(filePath) {
  * @param {string} output - Output file path
  * @param {Array<{path: string, options: string[]}>} inputs - List of inputs with their specific options
  * @param {string[]} globalOptions - Global options for mkvmerge
+ * @param {function} onStart - Receives the child process
  */
-async function mergeFiles(output, inputs, globalOptions = []) {
+async function mergeFiles(output, inputs, globalOptions = [], onStart) {
     const args = ['-o', output, ...globalOptions];
 
     for (const input of inputs) {
@@ -55,10 +59,27 @@ async function mergeFiles(output, inputs, globalOptions = []) {
     }
 
     console.log('Running mkvmerge with args:', args.join(' '));
-    return runMkvMerge(args);
+    return runMkvMerge(args, onStart);
+}
+
+/**
+ * Builds an mkvmerge --sync value from a fitted delay model
+ * (delay = delay_ms + timestamp * factor).
+ * @param {number} trackId - Track ID in its input file
+ * @param {{delay_ms: number, factor: number}} model - Model written by adaptive_sync.py
+ * @returns {string} e.g. "0:-950" or "0:-950,10004171/10000000"
+ */
+function formatSyncOption(trackId, model) {
+    const delay = Math.round(model.delay_ms);
+    if (!model.factor || Math.abs(model.factor - 1) < 1e-9) {
+        return `${trackId}:${delay}`;
+    }
+    const denominator = 10000000;
+    return `${trackId}:${delay},${Math.round(model.factor * denominator)}/${denominator}`;
 }
 
 module.exports = {
     getMkvInfo,
-    mergeFiles
+    mergeFiles,
+    formatSyncOption
 };
@@ -0,0 +1,107 @@
+/**
+ * Main process side of the pipeline orchestrator (orchestrator.js).
+ *
+ * Forks the orchestrator on first use, turns requests into promises matched
+ * by ID, and relays its batched log/progress messages. If the orchestrator
+ * exits, pending requests are rejected and the next request starts a new one.
+ */
+class OrchestratorClient {
+    /**
+     * @param {Object} options
+     * @param {function(): Object} options.fork - Starts the orchestrator. Returns a handle with
+     *   postMessage(message), kill(), and 'message' / 'exit' events
+     * @param {function(string, any)} options.onBus - Receives log/progress batches (channel, payload)
+     * @param {function(string, string)} [options.log] - Reports orchestrator failures (message, type)
+     * @param {number} [options.shutdownTimeoutMs=5000] - How long shutdown waits before killing it
+     */
+    constructor({ fork, onBus, log = () => { }, shutdownTimeoutMs = 5000 }) {
+        this.fork = fork;
+        this.onBus = onBus;
+        this.log = log;
+        this.shutdownTimeoutMs = shutdownTimeoutMs;
+
+        this.child = null;
+        this.nextId = 1;
+        this.pending = new Map(); // id -> { resolve, reject }
+    }
+
+    get running() {
+        return this.child !== null;
+    }
+
+    start() {
+        if (this.child) return this.child;
+
+        const child = this.fork();
+        this.child = child;
+        child.on('message', (message) => this.handleMessage(message));
+        child.on('exit', (code) => {
+            if (this.child !== child) return;
+            this.child = null;
+            if (this.pending.size > 0) {
+                this.log(`Orchestrator exited with code ${code}.`, 'error');
+            }
+            for (const { reject } of this.pending.values()) {
+                reject(new Error(`Orchestrator exited with code ${code}`));
+            }
+            this.pending.clear();
+        });
+        return child;
+    }
+
+    handleMessage(message) {
+        if (message.type === 'bus') {
+            this.onBus(message.channel, message.payload);
+        } else if (message.type === 'response') {
+            const request = this.pending.get(message.id);
+            if (!request) return;
+            this.pending.delete(message.id);
+            if (message.error !== undefined) {
+                request.reject(new Error(message.error));
+            } else {
+                request.resolve(message.result);
+            }
+        }
+    }
+
+    /**
+     * Sends a request to the orchestrator.
+     * @param {string} method - sync, preview, batch, cancel, get-files, get-media-info or get-log-history
+     * @param {Object} [params]
+     * @returns {Promise<any>}
+     */
+    request(method, params = {}) {
+        const child = this.start();
+        const id = `req-${this.nextId++}`;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+            child.postMessage({ type: 'request', id, method, params });
+        });
+    }
+
+    /**
+     * Asks the orchestrator to cancel its jobs and exit, killing it if it
+     * does not exit in time.
+     * @returns {Promise<void>}
+     */
+    shutdown() {
+        const child = this.child;
+        if (!child) return Promise.resolve();
+
+        return new Promise((resolve) => {
+            const timer = setTimeout(() => {
+                child.kill();
+                resolve();
+            }, this.shutdownTimeoutMs);
+            child.on('exit', () => {
+                clearTimeout(timer);
+                resolve();
+            });
+            child.postMessage({ type: 'shutdown' });
+        });
+    }
+}
+
+module.exports = {
+    OrchestratorClient
+};
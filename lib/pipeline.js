@@ -0,0 +1,350 @@
+const path = require('path');
+const fs = require('fs');
+const { getMediaInfo, convertFps, extractAudioTrack, cleanAudio, encodeAudio, muxPreviewClip } = require('./ffmpeg');
+const { getMkvInfo, mergeFiles, formatSyncOption } = require('./mkv');
+const { JobSupervisor, execFileTree } = require('./supervisor');
+
+/**
+ * Runs the full sync chain for one source/target pair:
+ * FPS conversion, extraction, cleaning, analysis, encoding and merge.
+ * Every child process and intermediate file is tracked by the JobSupervisor,
+ * so cancellation or failure releases them immediately.
+ * @param {string} sourceFile - Audio provider
+ * @param {string} targetFile - Video provider
+ * @param {number|string} trackIndex - Audio track of the source
+ * @param {Object} options
+ * @param {JobSupervisor} [options.job] - Supervisor to use (created if omitted)
+ * @param {string} options.outputDir - Where intermediates and the result are written
+ * @param {string} options.scriptPath - Path to adaptive_sync.py
+ * @param {function(string, string)} [options.log] - Log callback (message, type)
+ * @param {function(number, string)} [options.sendProgress] - Progress callback (percent, text)
+ * @param {Object[]} [options.prior] - Delay maps of earlier episodes of the same series
+ * @param {function(Object)} [options.onDelayMap] - Receives this episode's delay map, to use as a later prior
+ * @param {number} [options.analysisRate] - Analysis sample rate in Hz (analyser default if omitted)
+ * @param {number} [options.maxDecoders] - ffmpeg decodes the analyser runs at once (analyser default if omitted)
+ * @returns {Promise<string>} Path of the merged output
+ */
+async function processSync(sourceFile, targetFile, trackIndex, options) {
+    return runJob(runSyncJob, sourceFile, targetFile, trackIndex, options);
+}
+
+/**
+ * Runs the chain up to the analysis, then renders only a few short clips
+ * (at each delay change, or spread over the title) muxed with re-encoded
+ * slices of the target video, so the sync can be checked before a full render.
+ * Takes the same arguments as processSync.
+ * @returns {Promise<{previewDir: string, clips: Array<{path: string, start: number, delay: number}>, segments: Array}>}
+ */
+async function previewSync(sourceFile, targetFile, trackIndex, options) {
+    return runJob(runPreviewJob, sourceFile, targetFile, trackIndex, options);
+}
+
+async function runJob(run, sourceFile, targetFile, trackIndex, options) {
+    const {
+        job = new JobSupervisor(),
+        log = (message) => console.log(message),
+        sendProgress = () => { }
+    } = options;
+    const context = { ...options, log, sendProgress };
+
+    try {
+        return await run(job, sourceFile, targetFile, trackIndex, context);
+    } catch (e) {
+        if (job.cancelled) throw new Error('Operation cancelled');
+        throw e instanceof Error ? e : new Error(e.error ? e.error.message : String(e));
+    } finally {
+        const removed = await job.cleanup();
+        if (removed > 0) log(`Removed ${removed} temporary file(s).`);
+    }
+}
+
+/**
+ * Converts FPS if needed, then extracts and cleans the source audio track.
+ * @returns {Promise<string>} Cleaned audio file for the analyser
+ */
+async function prepareAudio(job, sourceFile, targetFile, trackIndex, { outputDir, log, sendProgress }) {
+    const onStart = (child) => job.track(child);
+
+    log(`Processing: ${path.basename(sourceFile)} -> ${path.basename(targetFile)}`, 'info');
+    sendProgress(0, 'Initializing...');
+
+    await fs.promises.mkdir(outputDir, { recursive: true });
+
+    const sourceInfo = await getMediaInfo(sourceFile);
+    const targetInfo = await getMediaInfo(targetFile);
+
+    let audioSourceForSync = sourceFile;
+
+    // FPS Conversion
+    if (Math.abs(sourceInfo.fps - targetInfo.fps) > 0.1) {
+        job.throwIfCancelled();
+        log(`FPS mismatch (${sourceInfo.fps} vs ${targetInfo.fps}). Converting...`, 'warning');
+        sendProgress(0, 'Converting FPS...');
+
+        const convertedFile = job.tempFile(path.join(outputDir, `converted_${job.id}.mkv`));
+        await convertFps(sourceFile, convertedFile, targetInfo.fps, (progress, text) => {
+            sendProgress(progress, text || 'Converting...');
+        }, onStart);
+
+        audioSourceForSync = convertedFile;
+        log('Conversion complete.', 'success');
+    }
+
+    // Extraction
+    job.throwIfCancelled();
+    log('Extracting and cleaning audio...', 'info');
+    sendProgress(-1, 'Extracting Audio...');
+
+    const audioRaw = job.tempFile(path.join(outputDir, `audio_extracted_${job.id}.ac3`));
+    const audioClean = job.tempFile(path.join(outputDir, `audio_clean_${job.id}.ac3`));
+
+    await extractAudioTrack(audioSourceForSync, trackIndex, audioRaw, onStart);
+
+    job.throwIfCancelled();
+    sendProgress(-1, 'Cleaning Audio...');
+    await cleanAudio(audioRaw, audioClean, 192, (progress, text) => {
+        sendProgress(progress, text || 'Cleaning Audio...');
+    }, onStart);
+
+    log('Audio extracted and cleaned.', 'success');
+    return audioClean;
+}
+
+/**
+ * Runs adaptive_sync.py, streaming its output to the log line by line.
+ */
+function runAnalyser(job, scriptPath, args, log) {
+    return new Promise((resolve, reject) => {
+        // Analyser output is streamed line by line; Python block-buffers a
+        // piped stdout unless told not to
+        let pending = '';
+        const env = { ...process.env, PYTHONUNBUFFERED: '1' };
+        const child = execFileTree('python', [scriptPath, ...args], { supervised: true, env }, (error, stdout, stderr) => {
+            if (pending) log(pending);
+            if (error) {
+                if (job.cancelled) {
+                    reject(new Error('Operation cancelled'));
+                } else {
+                    log(`Sync Error: ${error.message}`, 'error');
+                    reject(error);
+                }
+            } else {
+                resolve();
+            }
+        });
+        job.track(child);
+
+        child.stdout.on('data', (data) => {
+            pending += data.toString();
+            const lastBreak = pending.lastIndexOf('\n');
+            if (lastBreak !== -1) {
+                log(pending.slice(0, lastBreak));
+                pending = pending.slice(lastBreak + 1);
+            }
+        });
+    });
+}
+
+/**
+ * Analyser tuning options shared by the sync and preview jobs.
+ * @returns {string[]}
+ */
+function analyserTuningArgs({ analysisRate, maxDecoders }) {
+    const args = [];
+    if (analysisRate) args.push('--rate', String(analysisRate));
+    if (maxDecoders) args.push('--max-decoders', String(maxDecoders));
+    return args;
+}
+
+/**
+ * Adds the prior and delay map arguments for the analyser. The prior holds
+ * the delay maps of earlier episodes of the same series; the analyser
+ * searches around their delays first and widens only when they do not hold.
+ * @returns {Promise<string|null>} Delay map file to read after the run
+ */
+async function addDelayMapArgs(job, args, context) {
+    const { outputDir, prior, onDelayMap } = context;
+    if (prior && prior.length > 0) {
+        const priorFile = job.tempFile(path.join(outputDir, `sync_prior_${job.id}.json`));
+        await fs.promises.writeFile(priorFile, JSON.stringify({ episodes: prior }));
+        args.push('--prior', priorFile);
+    }
+    if (!onDelayMap) return null;
+    const delayMapFile = job.tempFile(path.join(outputDir, `delay_map_${job.id}.json`));
+    args.push('--delay-map-out', delayMapFile);
+    return delayMapFile;
+}
+
+async function reportDelayMap(delayMapFile, context) {
+    if (!delayMapFile) return;
+    try {
+        context.onDelayMap(JSON.parse(await fs.promises.readFile(delayMapFile, 'utf8')));
+    } catch (e) {
+        // Not written (e.g. no reliable sync); later episodes just get no prior from this one
+    }
+}
+
+async function runSyncJob(job, sourceFile, targetFile, trackIndex, context) {
+    const { outputDir, scriptPath, log, sendProgress } = context;
+    const onStart = (child) => job.track(child);
+
+    const audioSourceForSync = await prepareAudio(job, sourceFile, targetFile, trackIndex, context);
+
+    // Sync
+    job.throwIfCancelled();
+    // The analyser probes the title first and picks the cheapest engine;
+    // its PLAN line is recorded in the job log.
+    log('Calculating sync offset...', 'info');
+    sendProgress(-1, 'Synchronizing...');
+    const syncedWav = job.tempFile(path.join(outputDir, `synced_audio_${job.id}.wav`));
+    const modelFile = job.tempFile(path.join(outputDir, `sync_model_${job.id}.json`));
+    // Full-quality clean audio the analyser decodes in the background when it renders
+    const hqFile = job.tempFile(path.join(outputDir, `sync_hq_${job.id}.s16le`));
+    // Raw dense scan, kept next to the output for re-tuning with resegment.py.
+    // Only the dense engine writes it; the clean audio it renders from is
+    // kept next to it. Both are removed if the job fails.
+    const targetName = path.basename(targetFile, path.extname(targetFile));
+    const scanFile = job.tempFile(path.join(outputDir, `${targetName}_scan.npz`));
+    const scanAudio = path.join(outputDir, `${targetName}_scan_audio${path.extname(audioSourceForSync)}`);
+    // A scan left by an earlier run would not match this run's audio
+    await Promise.all([scanFile, scanAudio].map(file => fs.promises.rm(file, { force: true })));
+
+    const args = [audioSourceForSync, targetFile, syncedWav, '--model-out', modelFile, '--engine', 'auto',
+        '--scan-out', scanFile, '--scan-audio', scanAudio, '--hq-temp', hqFile, ...analyserTuningArgs(context)];
+    const delayMapFile = await addDelayMapArgs(job, args, context);
+
+    await runAnalyser(job, scriptPath, args, log);
+    log('Sync complete.', 'success');
+    await reportDelayMap(delayMapFile, context);
+
+    // A constant or linear delay map is applied by mkvmerge on the cleaned
+    // bitstream, so no WAV is rendered and nothing is re-encoded.
+    let syncModel = null;
+    try {
+        syncModel = JSON.parse(await fs.promises.readFile(modelFile, 'utf8'));
+    } catch (e) {
+        // No model: the analyser rendered the synced WAV
+    }
+
+    let finalAudio;
+    let syncOption = '0:0';
+    if (syncModel) {
+        syncOption = formatSyncOption(0, syncModel);
+        log(`Delay map is ${syncModel.model}. Muxing directly with --sync ${syncOption}.`, 'info');
+        finalAudio = audioSourceForSync;
+    } else {
+        // Encode
+        job.throwIfCancelled();
+        log('Encoding to AC3...', 'info');
+        sendProgress(-1, 'Encoding Final Audio...');
+        finalAudio = job.tempFile(path.join(outputDir, `synced_audio_${job.id}.ac3`));
+        await encodeAudio(syncedWav, finalAudio, 'ac3', 192, onStart);
+    }
+
+    // Merge
+    job.throwIfCancelled();
+    log('Merging files...', 'info');
+    sendProgress(-1, 'Merging...');
+    const outputName = path.basename(targetFile, path.extname(targetFile)) + '_synced.mkv';
+    const finalOutput = path.join(outputDir, outputName);
+    // Merged under a temp name and renamed on success, so a failed or
+    // cancelled rerun never removes the output of an earlier run
+    const partialOutput = job.tempFile(path.join(outputDir, `${outputName}.partial_${job.id}.mkv`));
+
+    // Metadata
+    let audioMetadata = { language: 'und', title: 'Synced Audio' };
+    try {
+        const info = await getMkvInfo(sourceFile);
+        const track = info.tracks.find(t => t.id === parseInt(trackIndex));
+        if (track && track.properties) {
+            if (track.properties.language) audioMetadata.language = track.properties.language;
+            if (track.properties.track_name) audioMetadata.title = track.properties.track_name;
+        }
+    } catch (e) {
+        log('Could not fetch metadata, using defaults.');
+    }
+
+    const inputs = [
+        {
+            path: finalAudio,
+            options: [
+                '--sync', syncOption,
+                '--language', `0:${audioMetadata.language}`,
+                '--track-name', `0:${audioMetadata.title}`,
+                '--default-track', '0:yes'
+            ]
+        },
+        {
+            path: targetFile,
+            options: []
+        }
+    ];
+
+    await mergeFiles(partialOutput, inputs, [], onStart);
+    job.throwIfCancelled();
+    await fs.promises.rename(partialOutput, finalOutput);
+
+    if (await fs.promises.access(scanFile).then(() => true, () => false)) {
+        await fs.promises.rename(audioSourceForSync, scanAudio);
+        job.keep(scanFile);
+        log(`Scan kept for resegment.py: ${scanFile}`, 'info');
+    }
+    log(`Merge successful! Output: ${finalOutput}`, 'success');
+
+    return finalOutput;
+}
+
+async function runPreviewJob(job, sourceFile, targetFile, trackIndex, context) {
+    const { outputDir, scriptPath, log, sendProgress } = context;
+    const onStart = (child) => job.track(child);
+
+    const audioClean = await prepareAudio(job, sourceFile, targetFile, trackIndex, context);
+
+    job.throwIfCancelled();
+    log('Analysing for preview...', 'info');
+    sendProgress(-1, 'Synchronizing...');
+    const targetName = path.basename(targetFile, path.extname(targetFile));
+    const previewDir = path.join(outputDir, `${targetName}_preview`);
+    await fs.promises.rm(previewDir, { recursive: true, force: true });
+
+    // The output WAV argument is required but not written in preview mode
+    const unusedWav = path.join(previewDir, 'synced.wav');
+    const args = [audioClean, targetFile, unusedWav, '--engine', 'auto', '--preview', previewDir, ...analyserTuningArgs(context)];
+    const delayMapFile = await addDelayMapArgs(job, args, context);
+    await runAnalyser(job, scriptPath, args, log);
+    await reportDelayMap(delayMapFile, context);
+    let preview;
+    try {
+        preview = JSON.parse(await fs.promises.readFile(path.join(previewDir, 'preview.json'), 'utf8'));
+    } catch (e) {
+        if (e.code !== 'ENOENT') throw e;
+        // The analyser writes no preview when it finds nothing to align
+        throw new Error('No sync points found between the two audio tracks, so there is nothing to preview.');
+    }
+
+    // Clips are independent short encodes, mux them all at once
+    job.throwIfCancelled();
+    sendProgress(-1, 'Rendering preview...');
+    const clips = await Promise.all(preview.clips.map(async (clip) => {
+        const wav = job.tempFile(path.join(previewDir, clip.wav));
+        const output = path.join(previewDir, clip.wav.replace(/\.wav$/, '.mp4'));
+        try {
+            await muxPreviewClip(targetFile, wav, clip.start, preview.clip_sec, output, onStart);
+        } catch (e) {
+            if (job.cancelled) throw e;
+            log(`Could not mux preview clip at ${clip.start.toFixed(1)}s: ${e.error ? e.error.message : e}`, 'warning');
+            return null;
+        }
+        return { path: output, start: clip.start, delay: clip.delay };
+    }));
+    job.throwIfCancelled();
+
+    const rendered = clips.filter(Boolean);
+    log(`Preview ready: ${rendered.length} clip(s) in ${previewDir}`, 'success');
+    return { previewDir, clips: rendered, segments: preview.segments };
+}
+
+module.exports = {
+    processSync,
+    previewSync
+};
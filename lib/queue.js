@@ -0,0 +1,335 @@
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+const crypto = require('crypto');
+
+/**
+ * Shared-directory job queue for running sync jobs on several machines.
+ *
+ * Layout (one directory per job):
+ *   <queue>/jobs/<id>/job.json     - Job spec { source, target, trackIndex }
+ *   <queue>/jobs/<id>/lock         - Claim { worker, beat, leaseMs }, created with O_EXCL
+ *   <queue>/jobs/<id>/lock.marker  - O_EXCL guard held while a lock is renewed, released or taken over
+ *   <queue>/jobs/<id>/job.log      - Log of the run
+ *   <queue>/jobs/<id>/result.json  - Outcome { status, output | error, delayMap }
+ *   <queue>/jobs/<id>/output/      - Intermediates and merged output
+ *
+ * A claim holds a lease that the owner renews with heartbeats: every renewal
+ * bumps the lock's beat counter. Clocks of different hosts are never
+ * compared. A worker considers a lease expired once it has seen the same
+ * beat for longer than the lease on its own clock, so a fresh worker waits
+ * one full lease before taking over. Renewal, release and takeover all run
+ * under the lock.marker guard, so a takeover can never interleave with the
+ * owner's read-then-write, and an owner whose lock was replaced aborts on
+ * its next heartbeat.
+ */
+
+const DEFAULT_LEASE_MS = 60 * 1000;
+
+function jobsDir(queueDir) {
+    return path.join(queueDir, 'jobs');
+}
+
+function newWorkerId() {
+    return `${os.hostname()}-${process.pid}-${crypto.randomBytes(3).toString('hex')}`;
+}
+
+async function readJson(file) {
+    try {
+        return JSON.parse(await fs.promises.readFile(file, 'utf8'));
+    } catch (e) {
+        return null;
+    }
+}
+
+async function exists(file) {
+    try {
+        await fs.promises.access(file);
+        return true;
+    } catch (e) {
+        return false;
+    }
+}
+
+/**
+ * Adds a job to the queue
+ * @param {string} queueDir
+ * @param {{source: string, target: string, trackIndex: (number|string)}} spec
+ * @returns {Promise<string>} Job ID
+ */
+async function enqueueJob(queueDir, spec) {
+    const id = `${Date.now()}-${crypto.randomBytes(4).toString('hex')}`;
+    const dir = path.join(jobsDir(queueDir), id);
+    await fs.promises.mkdir(dir, { recursive: true });
+    // Write then rename so workers never see a partial spec
+    const tmp = path.join(dir, `job.json.${process.pid}.tmp`);
+    await fs.promises.writeFile(tmp, JSON.stringify(spec, null, 2));
+    await fs.promises.rename(tmp, path.join(dir, 'job.json'));
+    return id;
+}
+
+// file -> { state, seenAt }: when this process first saw a lock beat or
+// marker holder, measured on the local clock only
+const observations = new Map();
+
+/**
+ * Whether `state` (a lock beat or marker holder) has stayed the same for
+ * longer than `timeoutMs`, as observed by this process.
+ */
+function unchangedFor(file, state, timeoutMs) {
+    const now = Date.now();
+    const seen = observations.get(file);
+    if (!seen || seen.state !== state) {
+        observations.set(file, { state, seenAt: now });
+        return false;
+    }
+    return now - seen.seenAt > timeoutMs;
+}
+
+/**
+ * Runs `fn` while holding the O_EXCL marker of a lock.
+ * @returns {Promise<{held: boolean, value: any}>} held is false if another worker holds it
+ */
+async function withMarker(lockFile, holder, leaseMs, fn) {
+    const marker = `${lockFile}.marker`;
+    const token = `${holder}:${crypto.randomBytes(4).toString('hex')}`;
+    try {
+        await fs.promises.writeFile(marker, token, { flag: 'wx' });
+    } catch (e) {
+        if (e.code !== 'EEXIST') throw e;
+        // Clear markers left behind by a worker that died while holding one
+        let current = null;
+        try {
+            current = await fs.promises.readFile(marker, 'utf8');
+        } catch (readError) {
+            // Released meanwhile
+        }
+        if (current !== null && unchangedFor(marker, current, leaseMs)) {
+            await fs.promises.unlink(marker).catch(() => { });
+        }
+        return { held: false, value: undefined };
+    }
+
+    try {
+        return { held: true, value: await fn() };
+    } finally {
+        await fs.promises.unlink(marker).catch(() => { });
+    }
+}
+
+/**
+ * A claimed job. Renews its lease until released.
+ */
+class Claim {
+    constructor(dir, workerId, leaseMs) {
+        this.dir = dir;
+        this.id = path.basename(dir);
+        this.workerId = workerId;
+        this.leaseMs = leaseMs;
+        this.lockFile = path.join(dir, 'lock');
+        this.beat = 0;
+        this.lost = false;
+        this.onLost = null;
+        this.timer = null;
+    }
+
+    lockContent() {
+        return JSON.stringify({
+            worker: this.workerId,
+            host: os.hostname(),
+            pid: process.pid,
+            beat: this.beat,
+            leaseMs: this.leaseMs
+        });
+    }
+
+    startHeartbeat() {
+        this.timer = setInterval(() => {
+            this.renew().catch(() => { });
+        }, Math.max(200, Math.floor(this.leaseMs / 4)));
+    }
+
+    /**
+     * Bumps the heartbeat. Detects a takeover by another worker. Skipped
+     * (retried on the next beat) while another worker holds the marker.
+     */
+    async renew() {
+        if (this.lost) return;
+        await withMarker(this.lockFile, this.workerId, this.leaseMs, async () => {
+            const lock = await readJson(this.lockFile);
+            if (!lock || lock.worker !== this.workerId) {
+                this.markLost();
+                return;
+            }
+            this.beat++;
+            const tmp = `${this.lockFile}.${this.workerId}.tmp`;
+            await fs.promises.writeFile(tmp, this.lockContent());
+            await fs.promises.rename(tmp, this.lockFile);
+        });
+    }
+
+    markLost() {
+        if (this.lost) return;
+        this.lost = true;
+        this.stopHeartbeat();
+        if (this.onLost) this.onLost();
+    }
+
+    stopHeartbeat() {
+        if (this.timer) clearInterval(this.timer);
+        this.timer = null;
+    }
+
+    async appendLog(message, type = 'info') {
+        const line = `[${new Date().toISOString()}] [${this.workerId}] [${type}] ${message}\n`;
+        await fs.promises.appendFile(path.join(this.dir, 'job.log'), line);
+    }
+
+    /**
+     * Writes the outcome of the job and releases the lock.
+     * @param {Object} result - { status: 'done' | 'failed', ... }
+     */
+    async complete(result) {
+        this.stopHeartbeat();
+        if (this.lost) return; // Another worker owns the job now
+        const tmp = path.join(this.dir, `result.json.${this.workerId}.tmp`);
+        await fs.promises.writeFile(tmp, JSON.stringify({ ...result, worker: this.workerId, finishedAt: new Date().toISOString() }, null, 2));
+        await fs.promises.rename(tmp, path.join(this.dir, 'result.json'));
+        await this.release();
+    }
+
+    async release() {
+        this.stopHeartbeat();
+        // The marker is only ever held for a few file operations
+        for (let attempt = 0; attempt < 50; attempt++) {
+            const { held } = await withMarker(this.lockFile, this.workerId, this.leaseMs, async () => {
+                const lock = await readJson(this.lockFile);
+                if (lock && lock.worker === this.workerId) {
+                    await fs.promises.unlink(this.lockFile).catch(() => { });
+                }
+            });
+            if (held) return;
+            await new Promise(resolve => setTimeout(resolve, 20));
+        }
+    }
+}
+
+/**
+ * Replaces an expired lock with our own, under the lock marker.
+ * @param {Claim} claim
+ * @param {Object} expired - Lock content that was observed to expire
+ * @returns {Promise<boolean>} Whether the claim now owns the lock
+ */
+async function takeOver(claim, expired) {
+    const { value } = await withMarker(claim.lockFile, claim.workerId, claim.leaseMs, async () => {
+        // Re-check under the marker: the owner may have renewed meanwhile
+        const lock = await readJson(claim.lockFile);
+        if (!lock || lock.worker !== expired.worker || lock.beat !== expired.beat) return false;
+
+        await fs.promises.unlink(claim.lockFile);
+        try {
+            await fs.promises.writeFile(claim.lockFile, claim.lockContent(), { flag: 'wx' });
+            return true;
+        } catch (e) {
+            return false; // A regular claim won the race for the fresh lock
+        }
+    });
+    return value === true;
+}
+
+/**
+ * Tries to claim one job directory.
+ * @returns {Promise<Claim|null>}
+ */
+async function tryClaim(dir, workerId, leaseMs) {
+    if (!await exists(path.join(dir, 'job.json'))) return null;
+    if (await exists(path.join(dir, 'result.json'))) return null;
+
+    const claim = new Claim(dir, workerId, leaseMs);
+    try {
+        // O_EXCL create: atomic, only one worker succeeds
+        await fs.promises.writeFile(claim.lockFile, claim.lockContent(), { flag: 'wx' });
+    } catch (e) {
+        if (e.code !== 'EEXIST') throw e;
+
+        const lock = await readJson(claim.lockFile);
+        // Unreadable locks are being rewritten by a heartbeat; retry later
+        if (!lock) return null;
+        const lockLeaseMs = Math.max(lock.leaseMs || 0, leaseMs);
+        if (!unchangedFor(claim.lockFile, `${lock.worker}:${lock.beat}`, lockLeaseMs)) return null;
+
+        if (!await takeOver(claim, lock)) return null;
+        observations.delete(claim.lockFile);
+        await claim.appendLog(`Took over expired lease of ${lock.worker}`, 'warning');
+    }
+
+    // The previous owner may have finished between the first check and our lock
+    if (await exists(path.join(dir, 'result.json'))) {
+        await claim.release();
+        return null;
+    }
+
+    claim.startHeartbeat();
+    return claim;
+}
+
+/**
+ * Claims the next available job in the queue.
+ * @param {string} queueDir
+ * @param {string} workerId
+ * @param {number} leaseMs
+ * @returns {Promise<Claim|null>}
+ */
+async function claimNextJob(queueDir, workerId, leaseMs = DEFAULT_LEASE_MS) {
+    let entries;
+    try {
+        entries = await fs.promises.readdir(jobsDir(queueDir));
+    } catch (e) {
+        return null;
+    }
+
+    // Oldest first (IDs start with a timestamp)
+    entries.sort();
+    for (const entry of entries) {
+        const claim = await tryClaim(path.join(jobsDir(queueDir), entry), workerId, leaseMs);
+        if (claim) return claim;
+    }
+    return null;
+}
+
+/**
+ * Finished jobs of the queue, most recent first.
+ * @param {string} queueDir
+ * @param {function(Object, Object): boolean} filter - Called with (spec, result)
+ * @param {number} limit
+ * @returns {Promise<Array<{spec: Object, result: Object}>>}
+ */
+async function recentResults(queueDir, filter, limit) {
+    let entries;
+    try {
+        entries = await fs.promises.readdir(jobsDir(queueDir));
+    } catch (e) {
+        return [];
+    }
+
+    const found = [];
+    for (const entry of entries.sort().reverse()) {
+        const dir = path.join(jobsDir(queueDir), entry);
+        const result = await readJson(path.join(dir, 'result.json'));
+        if (!result) continue;
+        const spec = await readJson(path.join(dir, 'job.json'));
+        if (!spec || !filter(spec, result)) continue;
+        found.push({ spec, result });
+        if (found.length >= limit) break;
+    }
+    return found;
+}
+
+module.exports = {
+    DEFAULT_LEASE_MS,
+    newWorkerId,
+    enqueueJob,
+    claimNextJob,
+    recentResults,
+    readJson
+};
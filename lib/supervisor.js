@@ -0,0 +1,174 @@
+const { execFile, spawn } = require('child_process');
+const fs = require('fs');
+const crypto = require('crypto');
+
+const isWindows = process.platform === 'win32';
+const MAX_OUTPUT = 1024 * 1024; // Bytes of stdout/stderr kept per supervised child
+
+/**
+ * Drop-in replacement for child_process.execFile.
+ * With `supervised: true` the child is started in its own process group
+ * (POSIX) so the whole tree, including children of children, can be signalled
+ * at once. execFile ignores `detached`, hence the spawn-based path.
+ * Unsupervised children stay in our group so Ctrl+C still reaches them in CLI mode.
+ * @param {string} file
+ * @param {string[]} args
+ * @param {Object} options - spawn options plus `supervised`
+ * @param {function(Error, string, string)} callback
+ * @returns {ChildProcess}
+ */
+function execFileTree(file, args, options, callback) {
+    const { supervised, ...spawnOpts } = options || {};
+    if (!supervised) return execFile(file, args, spawnOpts, callback);
+
+    const child = spawn(file, args, { ...spawnOpts, detached: !isWindows });
+    let stdout = '';
+    let stderr = '';
+    // Keep only the tail: long ffmpeg runs print megabytes of progress
+    const append = (buffer, data) => {
+        buffer += data.toString();
+        return buffer.length > MAX_OUTPUT ? buffer.slice(-MAX_OUTPUT) : buffer;
+    };
+    child.stdout.on('data', (data) => { stdout = append(stdout, data); });
+    child.stderr.on('data', (data) => { stderr = append(stderr, data); });
+
+    let done = false;
+    const finish = (error) => {
+        if (done) return;
+        done = true;
+        if (callback) callback(error, stdout, stderr);
+    };
+    child.on('error', finish);
+    child.on('close', (code, signal) => {
+        if (code === 0) return finish(null);
+        const error = new Error(`Command failed: ${file} ${args.join(' ')}`);
+        error.code = code;
+        error.signal = signal;
+        error.killed = signal !== null;
+        finish(error);
+    });
+    return child;
+}
+
+function signalTree(child, signal) {
+    if (isWindows) {
+        // taskkill /T walks the process tree; there is no graceful signal
+        execFile('taskkill', ['/pid', String(child.pid), '/T', '/F'], () => { });
+        return;
+    }
+    try {
+        process.kill(-child.pid, signal); // Negative PID: whole process group
+    } catch (e) {
+        try { child.kill(signal); } catch (_) { }
+    }
+}
+
+/**
+ * Terminates a child process and all its descendants.
+ * Sends SIGTERM first so cooperative children (the Python analyser) can clean
+ * up, then SIGKILL to anything still alive after the grace period.
+ * @param {ChildProcess} child
+ * @param {number} graceMs
+ */
+function killTree(child, graceMs = 2000) {
+    return new Promise((resolve) => {
+        if (!child.pid) return resolve();
+
+        const finish = () => {
+            clearTimeout(killTimer);
+            clearTimeout(giveUpTimer);
+            // Grandchildren may outlive the group leader
+            if (!isWindows) signalTree(child, 'SIGKILL');
+            resolve();
+        };
+
+        const killTimer = setTimeout(() => signalTree(child, 'SIGKILL'), graceMs);
+        const giveUpTimer = setTimeout(finish, graceMs + 1000);
+
+        if (child.exitCode !== null || child.signalCode !== null) return finish();
+        child.once('exit', finish);
+        signalTree(child, 'SIGTERM');
+    });
+}
+
+/**
+ * Tracks every child process and temporary file of a single sync job so
+ * that cancellation or failure releases CPU and disk space immediately.
+ */
+class JobSupervisor {
+    constructor() {
+        // Unique per job, for file names in directories shared by concurrent jobs
+        this.id = `${Date.now()}-${crypto.randomBytes(4).toString('hex')}`;
+        this.children = new Set();
+        this.tempFiles = new Set();
+        this.cancelled = false;
+    }
+
+    /**
+     * Registers a child process. Suitable as an `onStart` callback.
+     * @param {ChildProcess} child
+     */
+    track(child) {
+        if (this.cancelled) {
+            killTree(child);
+            return;
+        }
+        this.children.add(child);
+        child.once('exit', () => this.children.delete(child));
+    }
+
+    /**
+     * Registers a temporary file to be removed on cleanup.
+     * @param {string} filePath
+     * @returns {string} The same path
+     */
+    tempFile(filePath) {
+        this.tempFiles.add(filePath);
+        return filePath;
+    }
+
+    /**
+     * Stops tracking a file so cleanup keeps it (e.g. the final output).
+     * @param {string} filePath
+     */
+    keep(filePath) {
+        this.tempFiles.delete(filePath);
+    }
+
+    throwIfCancelled() {
+        if (this.cancelled) throw new Error('Operation cancelled');
+    }
+
+    /**
+     * Kills all tracked process trees.
+     */
+    async cancel() {
+        this.cancelled = true;
+        await Promise.all([...this.children].map(child => killTree(child)));
+        this.children.clear();
+    }
+
+    /**
+     * Removes all tracked temporary files.
+     * @returns {Promise<number>} Number of files removed
+     */
+    async cleanup() {
+        let removed = 0;
+        for (const file of this.tempFiles) {
+            try {
+                await fs.promises.unlink(file);
+                removed++;
+            } catch (e) {
+                if (e.code !== 'ENOENT') console.warn(`Could not delete ${file}: ${e.message}`);
+            }
+        }
+        this.tempFiles.clear();
+        return removed;
+    }
+}
+
+module.exports = {
+    execFileTree,
+    killTree,
+    JobSupervisor
+};
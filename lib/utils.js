@@ -11,6 +11,68 @@ function getMkvFiles(dir) {
     }
 }
 
+/**
+ * Non-blocking getMkvFiles
+ * @param {string} dir
+ * @returns {Promise<string[]>} Full paths of the MKV files in dir (empty if it does not exist)
+ */
+async function listMkvFiles(dir) {
+    try {
+        return (await fs.promises.readdir(dir))
+            .filter(file => file.toLowerCase().endsWith('.mkv'))
+            .map(file => path.join(dir, file));
+    } catch (e) {
+        return [];
+    }
+}
+
+// Episode number patterns, most specific first
+const EPISODE_PATTERNS = [
+    /(\d+)[xX](\d+)/, // 5x05
+    /[sS](\d+)[eE](\d+)/, // S05E05
+    /(\d+)/ // Just a number
+];
+
+function parseEpisode(fileName) {
+    for (const r of EPISODE_PATTERNS) {
+        const m = fileName.match(r);
+        if (m) {
+            return { full: m[0], s: parseInt(m[1]), e: parseInt(m[2] || m[1]) }; // Handle single number case
+        }
+    }
+    return null;
+}
+
+/**
+ * Pairs source and target file names by season/episode number
+ * @param {string[]} sourceFiles - Source file names
+ * @param {string[]} targetFiles - Target file names
+ * @returns {Array<{source: string, target: string}>}
+ */
+function matchEpisodes(sourceFiles, targetFiles) {
+    // Parse every target once; the first file of each episode wins
+    const targetsByEpisode = new Map();
+    for (const tFile of targetFiles) {
+        const tMatch = parseEpisode(tFile);
+        const key = tMatch && `${tMatch.s}x${tMatch.e}`;
+        if (key && !targetsByEpisode.has(key)) targetsByEpisode.set(key, tFile);
+    }
+
+    const matches = [];
+    for (const sFile of sourceFiles) {
+        const sMatch = parseEpisode(sFile);
+        if (!sMatch) continue;
+
+        // Find counterpart in target
+        const tFile = targetsByEpisode.get(`${sMatch.s}x${sMatch.e}`);
+        if (tFile) matches.push({ source: sFile, target: tFile });
+    }
+    return matches;
+}
+
 module.exports = {
-    getMkvFiles
+    getMkvFiles,
+    listMkvFiles,
+    parseEpisode,
+    matchEpisodes
 };
@@ -0,0 +1,280 @@
+const path = require('path');
+const fs = require('fs');
+const { listMkvFiles, matchEpisodes } = require('./lib/utils');
+const { getMediaInfo } = require('./lib/ffmpeg');
+const { LogBus } = require('./lib/logbus');
+const { JobSupervisor } = require('./lib/supervisor');
+const { processSync, previewSync } = require('./lib/pipeline');
+
+// Pipeline orchestrator. The Electron main process runs it as a utility
+// process (see lib/orchestrator-client.js), so file system work, parsing
+// of child output and episode matching never stall the window or its IPC.
+// Any number of operations can run at once; each has its own supervisors.
+// sync, preview and batch requests may name their operation with
+// params.operationId (the request ID otherwise); progress updates carry it
+// as jobId and cancel takes it to stop just that operation.
+//
+// Messages from the parent:
+//   { type: 'request', id, method, params }
+//   { type: 'shutdown' }                      - Cancel everything and exit
+// Messages to the parent:
+//   { type: 'response', id, result } | { type: 'response', id, error }
+//   { type: 'bus', channel, payload }         - Batched logs/progress for the renderer
+
+// Delay maps of earlier episodes passed to the analyser as a prior
+const BATCH_PRIOR_EPISODES = 5;
+
+// Electron utility processes talk through parentPort; plain Node children
+// (child_process.fork) through process.send
+function post(message) {
+    if (process.parentPort) {
+        process.parentPort.postMessage(message);
+    } else if (process.send) {
+        process.send(message);
+    }
+}
+
+function onParentMessage(handler) {
+    if (process.parentPort) {
+        process.parentPort.on('message', (event) => handler(event.data));
+    } else {
+        process.on('message', handler);
+    }
+}
+
+const logBus = new LogBus({
+    send: (channel, payload) => post({ type: 'bus', channel, payload })
+});
+
+function log(message, type = 'info') {
+    logBus.log(message, type);
+    console.log(message);
+}
+
+/**
+ * One user operation (single sync, preview or batch). Cancelling it stops
+ * its loop and kills every process tree of its running job.
+ */
+class Operation {
+    constructor(id) {
+        this.id = id;
+        this.cancelled = false;
+        this.job = null;
+        this.done = null; // Settles once the operation and its job cleanup finished
+    }
+
+    sendProgress(percent, text = '') {
+        logBus.progress(percent, text, this.id);
+    }
+
+    async cancel() {
+        this.cancelled = true;
+        if (this.job) await this.job.cancel();
+    }
+
+    /**
+     * Runs one pipeline job (processSync or previewSync) under this operation.
+     */
+    async runJob(run, sourceFile, targetFile, trackIndex, options) {
+        if (this.cancelled) throw new Error('Operation cancelled by user');
+
+        const job = new JobSupervisor();
+        this.job = job;
+        try {
+            return await run(sourceFile, targetFile, trackIndex, {
+                ...options,
+                job,
+                log,
+                sendProgress: (percent, text) => this.sendProgress(percent, text)
+            });
+        } finally {
+            if (this.job === job) this.job = null;
+        }
+    }
+}
+
+const operations = new Map(); // id -> Operation
+
+async function runOperation(id, body) {
+    if (operations.has(id)) throw new Error(`Operation ${id} is already running`);
+    const operation = new Operation(id);
+    operations.set(id, operation);
+    const run = body(operation);
+    operation.done = run.catch(() => { });
+    try {
+        return await run;
+    } finally {
+        operations.delete(id);
+    }
+}
+
+async function runSync(operation, { sourceFile, targetFile, trackIndex, outputDir, scriptPath, analysisRate, maxDecoders }) {
+    try {
+        operation.sendProgress(0, 'Starting...');
+        log('Starting sync process...', 'info');
+
+        const outputPath = await operation.runJob(processSync, sourceFile, targetFile, trackIndex, { outputDir, scriptPath, analysisRate, maxDecoders });
+
+        operation.sendProgress(100, 'Done!');
+        return { success: true, outputPath };
+
+    } catch (error) {
+        if (error.message.includes('cancelled')) {
+            log('Process cancelled by user.', 'warning');
+        } else {
+            log(`Error: ${error.message}`, 'error');
+        }
+        operation.sendProgress(0, 'Cancelled');
+        throw error;
+    }
+}
+
+async function runPreview(operation, { sourceFile, targetFile, trackIndex, outputDir, scriptPath, analysisRate, maxDecoders }) {
+    try {
+        operation.sendProgress(0, 'Starting...');
+        log('Starting preview...', 'info');
+
+        const preview = await operation.runJob(previewSync, sourceFile, targetFile, trackIndex, { outputDir, scriptPath, analysisRate, maxDecoders });
+
+        operation.sendProgress(100, 'Preview ready');
+        return { success: true, ...preview };
+
+    } catch (error) {
+        if (error.message.includes('cancelled')) {
+            log('Preview cancelled by user.', 'warning');
+        } else {
+            log(`Error: ${error.message}`, 'error');
+        }
+        operation.sendProgress(0, 'Cancelled');
+        throw error;
+    }
+}
+
+async function runBatch(operation, { sourceFolder, targetFolder, outputDir, scriptPath, analysisRate, maxDecoders }) {
+    try {
+        operation.sendProgress(0, 'Scanning files...');
+        log('Starting Batch Sync...', 'info');
+
+        const [sourceFiles, targetFiles] = await Promise.all([
+            fs.promises.readdir(sourceFolder),
+            fs.promises.readdir(targetFolder)
+        ]).then(lists => lists.map(files => files.filter(f => f.endsWith('.mkv'))));
+
+        log(`Found ${sourceFiles.length} source files and ${targetFiles.length} target files.`);
+
+        // Match files
+        const matches = matchEpisodes(sourceFiles, targetFiles).map(({ source, target }) => ({
+            source: path.join(sourceFolder, source),
+            target: path.join(targetFolder, target)
+        }));
+
+        log(`Matched ${matches.length} pairs.`);
+        if (matches.length === 0) {
+            log('No matches found. Check file naming.', 'error');
+            return { success: false };
+        }
+
+        // Episodes of a season share intro/logo/ad-break offsets, so the delay
+        // maps of the last few episodes seed the analysis of the next one
+        const priorEpisodes = [];
+
+        let completed = 0;
+        for (const match of matches) {
+            if (operation.cancelled) {
+                log('Batch processing cancelled.', 'warning');
+                break;
+            }
+
+            log(`Batch ${completed + 1}/${matches.length}: ${path.basename(match.source)}`, 'info');
+            operation.sendProgress((completed / matches.length) * 100, `Batch: ${completed + 1}/${matches.length} - ${path.basename(match.source)}`);
+
+            try {
+                // Batch mode uses the first audio track of each source
+                const info = await getMediaInfo(match.source);
+                const trackIndex = info.audioTracks.length > 0 ? info.audioTracks[0].index : 1;
+
+                await operation.runJob(processSync, match.source, match.target, trackIndex, {
+                    outputDir,
+                    scriptPath,
+                    analysisRate,
+                    maxDecoders,
+                    prior: priorEpisodes.slice(-BATCH_PRIOR_EPISODES),
+                    onDelayMap: (map) => priorEpisodes.push(map)
+                });
+            } catch (e) {
+                if (e.message.includes('cancelled')) {
+                    throw e; // Propagate cancel
+                }
+                log(`Failed to sync ${path.basename(match.source)}: ${e.message}`, 'error');
+            }
+            completed++;
+            operation.sendProgress((completed / matches.length) * 100, `Batch: ${completed}/${matches.length} Done`);
+        }
+
+        log('Batch processing complete!', 'success');
+        return { success: true };
+
+    } catch (error) {
+        if (error.message.includes('cancelled')) {
+            log('Batch cancelled.', 'warning');
+        } else {
+            log(`Batch Error: ${error.message}`, 'error');
+        }
+        operation.sendProgress(0, 'Cancelled');
+        throw error;
+    }
+}
+
+async function cancelOperations({ operationId } = {}) {
+    const targets = operationId ? [operations.get(operationId)].filter(Boolean) : [...operations.values()];
+    if (targets.length > 0) log('Cancelling active job...', 'warning');
+    await Promise.all(targets.map(async (operation) => {
+        try {
+            await operation.cancel(); // Kills every process tree of the job
+        } catch (e) {
+            log(`Error killing process: ${e.message}`, 'error');
+        }
+    }));
+    return true;
+}
+
+const methods = {
+    'sync': (params, id) => runOperation(params.operationId || id, op => runSync(op, params)),
+    'preview': (params, id) => runOperation(params.operationId || id, op => runPreview(op, params)),
+    'batch': (params, id) => runOperation(params.operationId || id, op => runBatch(op, params)),
+    'cancel': (params) => cancelOperations(params),
+    'get-log-history': ({ beforeSeq, limit } = {}) => logBus.getHistory(beforeSeq, limit),
+    'get-media-info': ({ filePath }) => getMediaInfo(filePath),
+    'get-files': async ({ cwd }) => {
+        const lists = await Promise.all([listMkvFiles(cwd), listMkvFiles(path.join(cwd, 'inputs'))]);
+        return lists.flat();
+    }
+};
+
+async function handleRequest({ id, method, params }) {
+    try {
+        if (!methods[method]) throw new Error(`Unknown method: ${method}`);
+        const result = await methods[method](params || {}, id);
+        post({ type: 'response', id, result });
+    } catch (e) {
+        post({ type: 'response', id, error: e.message || String(e) });
+    }
+}
+
+async function shutdown() {
+    const running = [...operations.values()].map(operation => operation.done);
+    await cancelOperations();
+    // Each job removes its temp files as it unwinds; the client kills this
+    // process if that takes too long
+    await Promise.all(running);
+    logBus.flush();
+    process.exit(0);
+}
+
+onParentMessage((message) => {
+    if (message.type === 'request') {
+        handleRequest(message);
+    } else if (message.type === 'shutdown') {
+        shutdown();
+    }
+});
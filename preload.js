@@ -4,10 +4,12 @@ contextBridge.exposeInMainWorld('api', {
     getFiles: () => ipcRenderer.invoke('get-files'),
     getMediaInfo: (filePath) => ipcRenderer.invoke('get-media-info', filePath),
     startSync: (data) => ipcRenderer.invoke('start-sync', data),
+    startPreview: (data) => ipcRenderer.invoke('start-preview', data),
     startBatchSync: (data) => ipcRenderer.invoke('start-batch-sync', data),
-    cancelSync: () => ipcRenderer.invoke('cancel-sync'),
-    onLog: (callback) => ipcRenderer.on('log', (event, data) => callback(data)),
-    onProgress: (callback) => ipcRenderer.on('progress', (event, percent) => callback(percent)),
+    cancelSync: (operationId) => ipcRenderer.invoke('cancel-sync', operationId),
+    onLogBatch: (callback) => ipcRenderer.on('log-batch', (event, entries) => callback(entries)),
+    getLogHistory: (options) => ipcRenderer.invoke('get-log-history', options),
+    onProgress: (callback) => ipcRenderer.on('progress', (event, update) => callback(update)),
     openFileDialog: () => ipcRenderer.invoke('open-file-dialog'),
     openFolderDialog: () => ipcRenderer.invoke('open-folder-dialog'),
     openOutputFolder: () => ipcRenderer.invoke('open-output-folder')
@@ -18,6 +18,10 @@ const translations = {
         cancelOp: 'Cancel Operation',
         cancelling: 'Cancelling...',
         openOutputFolder: 'Open Output Folder',
+        previewSync: 'Preview Sync',
+        previewTitle: 'Preview',
+        previewDelay: 'delay',
+        noPreviewClips: 'No preview clips could be rendered.',
         language: 'Language',
         noAudioTracks: 'No audio tracks found in source file.',
         successOutput: 'Success! Output',
@@ -47,6 +51,10 @@ const translations = {
         cancelOp: 'Cancelar Operación',
         cancelling: 'Cancelando...',
         openOutputFolder: 'Abrir Carpeta de Salida',
+        previewSync: 'Vista Previa',
+        previewTitle: 'Vista Previa',
+        previewDelay: 'retraso',
+        noPreviewClips: 'No se pudo generar ningún clip de vista previa.',
         language: 'Idioma',
         noAudioTracks: 'No se encontraron pistas de audio en el archivo fuente.',
         successOutput: '¡Éxito! Salida',
@@ -84,12 +92,17 @@ function updateUI() {
     });
 
     syncBtn.textContent = t('startSync');
+    previewBtn.textContent = t('previewSync');
+    document.getElementById('preview-title').textContent = t('previewTitle');
     if (!cancelBtn.disabled) cancelBtn.textContent = t('cancelOp');
     openFolderBtn.textContent = t('openOutputFolder');
     document.getElementById('lang-label').textContent = t('language');
 }
 
 const syncBtn = document.getElementById('sync-btn');
+const previewBtn = document.getElementById('preview-btn');
+const previewArea = document.getElementById('preview-area');
+const previewClips = document.getElementById('preview-clips');
 const cancelBtn = document.getElementById('cancel-btn');
 const openFolderBtn = document.getElementById('open-folder-btn');
 const logArea = document.getElementById('log-area');
@@ -120,16 +133,73 @@ const batchTargetFolder = document.getElementById('batch-target-folder');
 const batchTargetBrowse = document.getElementById('batch-target-browse');
 
 // Logging
-function log(message, type = 'info') {
+// Only the most recent lines are kept in the DOM; older ones are fetched
+// from the main process ring buffer when scrolling to the top.
+const MAX_LOG_ENTRIES = 1000;
+// While the user is scrolled up, trimming waits until this many lines so
+// history loaded on scroll-up is not removed again by the next batch
+const MAX_LOG_ENTRIES_SCROLLED = 5000;
+let oldestLogSeq = null; // Oldest main-process line currently shown
+let loadingHistory = false;
+
+function createLogEntry({ message, type = 'info', time = Date.now(), seq }) {
     const entry = document.createElement('div');
     entry.classList.add('log-entry', `log-${type}`);
-    entry.textContent = `[${new Date().toLocaleTimeString()}] ${message}`;
-    logArea.appendChild(entry);
-    logArea.scrollTop = logArea.scrollHeight; // Auto-scroll
+    entry.textContent = `[${new Date(time).toLocaleTimeString()}] ${message}`;
+    if (seq !== undefined) entry.dataset.seq = seq;
+    return entry;
+}
+
+function trimLog(atBottom) {
+    const limit = atBottom ? MAX_LOG_ENTRIES : MAX_LOG_ENTRIES_SCROLLED;
+    if (logArea.childElementCount > limit) {
+        const previousHeight = logArea.scrollHeight;
+        while (logArea.childElementCount > limit) {
+            logArea.removeChild(logArea.firstElementChild);
+        }
+        // Keep the lines being read in place
+        if (!atBottom) logArea.scrollTop -= previousHeight - logArea.scrollHeight;
+    }
+    const first = logArea.querySelector('.log-entry[data-seq]');
+    oldestLogSeq = first ? parseInt(first.dataset.seq) : oldestLogSeq;
+}
+
+function appendLogEntries(entries) {
+    const atBottom = logArea.scrollTop + logArea.clientHeight >= logArea.scrollHeight - 20;
+    const fragment = document.createDocumentFragment();
+    entries.forEach(e => fragment.appendChild(createLogEntry(e)));
+    logArea.appendChild(fragment);
+    trimLog(atBottom);
+    if (atBottom) logArea.scrollTop = logArea.scrollHeight; // Auto-scroll
 }
 
-window.api.onLog(({ message, type }) => {
-    log(message, type);
+function log(message, type = 'info') {
+    appendLogEntries([{ message, type }]);
+}
+
+window.api.onLogBatch((entries) => {
+    appendLogEntries(entries);
+});
+
+logArea.addEventListener('scroll', async () => {
+    if (logArea.scrollTop > 0 || loadingHistory || oldestLogSeq === null || oldestLogSeq === 0) return;
+
+    loadingHistory = true;
+    try {
+        const { entries } = await window.api.getLogHistory({ beforeSeq: oldestLogSeq, limit: 200 });
+        if (entries.length > 0) {
+            const previousHeight = logArea.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            entries.forEach(e => fragment.appendChild(createLogEntry(e)));
+            logArea.insertBefore(fragment, logArea.firstChild);
+            oldestLogSeq = entries[0].seq;
+            logArea.scrollTop = logArea.scrollHeight - previousHeight; // Keep position
+        } else {
+            oldestLogSeq = 0; // Nothing older available
+        }
+    } finally {
+        loadingHistory = false;
+    }
 });
 
 // Progress
@@ -151,7 +221,17 @@ function updateProgress(percent, text) {
     }
 }
 
-window.api.onProgress(({ percent, text }) => {
+// The operation the progress bar and cancel button belong to
+let currentOperationId = null;
+let nextOperation = 1;
+
+function beginOperation() {
+    currentOperationId = `op-${Date.now()}-${nextOperation++}`;
+    return currentOperationId;
+}
+
+window.api.onProgress(({ jobId, percent, text }) => {
+    if (jobId !== currentOperationId) return; // Another operation's update
     updateProgress(percent, text);
 });
 
@@ -162,6 +242,7 @@ modeSingleBtn.addEventListener('click', () => {
     modeBatchBtn.classList.remove('active');
     singleModeContainer.classList.remove('hidden');
     batchModeContainer.classList.add('hidden');
+    previewBtn.classList.remove('hidden');
     checkReady();
 });
 
@@ -171,6 +252,7 @@ modeBatchBtn.addEventListener('click', () => {
     modeSingleBtn.classList.remove('active');
     batchModeContainer.classList.remove('hidden');
     singleModeContainer.classList.add('hidden');
+    previewBtn.classList.add('hidden'); // Preview is per title
     checkReady();
 });
 
@@ -279,19 +361,23 @@ function checkReady() {
         ready = batchSourceFolder.value && batchTargetFolder.value;
     }
     syncBtn.disabled = !ready;
+    previewBtn.disabled = !ready || currentMode !== 'single';
 }
 
 // Sync Action
 syncBtn.addEventListener('click', async () => {
     syncBtn.disabled = true;
+    previewBtn.disabled = true;
     cancelBtn.classList.remove('hidden');
     openFolderBtn.classList.add('hidden');
     progressContainer.style.display = 'block';
     updateProgress(0, 'Starting...');
+    const operationId = beginOperation();
 
     try {
         if (currentMode === 'single') {
             const result = await window.api.startSync({
+                operationId,
                 sourceFile: sourceSelect.value,
                 targetFile: targetSelect.value,
                 trackIndex: trackSelect.value
@@ -302,6 +388,7 @@ syncBtn.addEventListener('click', async () => {
             }
         } else {
             const result = await window.api.startBatchSync({
+                operationId,
                 sourceFolder: batchSourceFolder.value,
                 targetFolder: batchTargetFolder.value
             });
@@ -321,11 +408,80 @@ syncBtn.addEventListener('click', async () => {
     }
 });
 
+// Preview Action
+function toFileUrl(filePath) {
+    const normalized = filePath.replace(/\\/g, '/');
+    // Keep Windows drive letters (C:) unescaped
+    const encoded = normalized.split('/').map(part => /^[A-Za-z]:$/.test(part) ? part : encodeURIComponent(part)).join('/');
+    return `file://${normalized.startsWith('/') ? '' : '/'}${encoded}`;
+}
+
+function formatTime(seconds) {
+    const m = Math.floor(seconds / 60);
+    const s = Math.floor(seconds % 60);
+    return `${m}:${String(s).padStart(2, '0')}`;
+}
+
+function showPreview(clips) {
+    previewClips.innerHTML = '';
+    clips.forEach(clip => {
+        const item = document.createElement('div');
+        item.classList.add('preview-clip');
+
+        const video = document.createElement('video');
+        video.src = toFileUrl(clip.path);
+        video.controls = true;
+        video.preload = 'metadata';
+
+        const label = document.createElement('div');
+        label.classList.add('preview-clip-label');
+        label.textContent = `${formatTime(clip.start)} · ${t('previewDelay')} ${clip.delay.toFixed(3)}s`;
+
+        item.appendChild(video);
+        item.appendChild(label);
+        previewClips.appendChild(item);
+    });
+    previewArea.classList.remove('hidden');
+}
+
+previewBtn.addEventListener('click', async () => {
+    syncBtn.disabled = true;
+    previewBtn.disabled = true;
+    cancelBtn.classList.remove('hidden');
+    previewArea.classList.add('hidden');
+    progressContainer.style.display = 'block';
+    updateProgress(0, 'Starting...');
+    const operationId = beginOperation();
+
+    try {
+        const result = await window.api.startPreview({
+            operationId,
+            sourceFile: sourceSelect.value,
+            targetFile: targetSelect.value,
+            trackIndex: trackSelect.value
+        });
+        if (result.success) {
+            if (result.clips.length === 0) {
+                log(t('noPreviewClips'), 'warning');
+            } else {
+                showPreview(result.clips);
+            }
+        }
+    } catch (e) {
+        if (!e.message.includes('cancelled')) {
+            log(`${t('operationFailed')}: ${e.message}`, 'error');
+        }
+    } finally {
+        cancelBtn.classList.add('hidden');
+        checkReady(); // Re-enable if inputs still valid
+    }
+});
+
 cancelBtn.addEventListener('click', async () => {
     cancelBtn.disabled = true;
     cancelBtn.textContent = 'Cancelling...';
     try {
-        await window.api.cancelSync();
+        await window.api.cancelSync(currentOperationId);
     } catch (e) {
         log(`Error cancelling: ${e.message}`, 'error');
     } finally {
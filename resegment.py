@@ -0,0 +1,44 @@
+import argparse
+import json
+
+from adaptive_sync import SEGMENT_DEFAULTS, load_scan, resegment
+
+# Re-tunes the dense scan post-processing from a scan saved with
+# `adaptive_sync.py --scan-out`, without decoding or correlating again:
+#
+#   python resegment.py scan.npz --min-quality 0.3 --look-ahead 5
+#   python resegment.py scan.npz --change-sec 0.05 --output synced.wav
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild sync segments from a saved sliding window scan.")
+    parser.add_argument('scan_file', help="Scan (.npz) written by adaptive_sync.py --scan-out")
+    parser.add_argument('--min-quality', type=float,
+                        help=f"Quality needed to accept a window (default: {SEGMENT_DEFAULTS['min_quality']})")
+    parser.add_argument('--jump-sec', type=float,
+                        help=f"Delay jumps above this must be verified (default: {SEGMENT_DEFAULTS['jump_sec']})")
+    parser.add_argument('--verify-score', type=float,
+                        help=f"Correlation needed to verify a jump (default: {SEGMENT_DEFAULTS['verify_score']})")
+    parser.add_argument('--change-sec', type=float,
+                        help=f"Delay change that starts a segment (default: {SEGMENT_DEFAULTS['change_sec']})")
+    parser.add_argument('--filter-window', type=int,
+                        help=f"Median filter length in points (default: {SEGMENT_DEFAULTS['filter_window']})")
+    parser.add_argument('--look-ahead', type=int,
+                        help=f"Points that must agree before a change (default: {SEGMENT_DEFAULTS['look_ahead']})")
+    parser.add_argument('--model-out',
+                        help="If the delays fit a constant/linear model, write it to this JSON file")
+    parser.add_argument('--segments-out', help="Write the segments (seconds) to this JSON file")
+    parser.add_argument('--output', help="Render the synced WAV from the clean file recorded in the scan")
+    parser.add_argument('--preview', help="Render preview clips and preview.json to this folder")
+    parser.add_argument('--clean', help="Clean audio to render from, if not the one recorded in the scan")
+    args = parser.parse_args()
+
+    segments = resegment(args.scan_file, args.output, args.model_out, args.preview, clean_file=args.clean,
+                         min_quality=args.min_quality, jump_sec=args.jump_sec, verify_score=args.verify_score,
+                         change_sec=args.change_sec, filter_window=args.filter_window, look_ahead=args.look_ahead)
+
+    if args.segments_out and segments:
+        scan, _ = load_scan(args.scan_file)
+        rate = float(scan['sample_rate'])
+        with open(args.segments_out, 'w') as f:
+            json.dump([{'start': s / rate, 'end': e / rate, 'delay': d / rate} for s, e, d in segments], f, indent=2)
+        print(f"Segments written to {args.segments_out}")
@@ -4,6 +4,10 @@ import os
 import sys
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor
+
+from sync_common import (DEFAULT_ANALYSIS_RATE, SyncCancelled, _child_processes, _temp_files,
+                         install_cancel_handlers, track_process, release_resources, refine_peak)
 
 def get_ffmpeg_path():
     """
@@ -24,8 +28,9 @@ def get_audio_info(file_path):
     ffmpeg_path = get_ffmpeg_path()
     command = [ffmpeg_path, '-i', file_path]
     
-    process = subprocess.Popen(command, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+    process = track_process(subprocess.Popen(command, stderr=subprocess.PIPE, stdout=subprocess.PIPE))
     _, stderr = process.communicate()
+    _child_processes.discard(process)
     stderr_str = stderr.decode('utf-8', errors='ignore')
     
     # Search for Stream #0:x: Audio: ...
@@ -65,8 +70,10 @@ def get_audio_data(file_path, target_sample_rate=None, target_channels=None):
     
     print(f"Extracting audio from {os.path.basename(file_path)} (sr={target_sample_rate}, ch={target_channels})...")
     try:
-        process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8)
+        process = track_process(subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, bufsize=10**8))
         raw_data = process.stdout.read()
+        process.wait()
+        _child_processes.discard(process)
         
         if not raw_data:
             raise Exception("No audio data extracted. Check if file has audio.")
@@ -227,7 +234,7 @@ def find_best_match(needle, haystack, search_start=None, search_end=None):
     """
     Finds the best match of 'needle' (Source segment) in 'haystack' (Reference audio).
     Optionally limits search to a window [search_start, search_end] in haystack.
-    Returns (start_index, quality_score).
+    Returns (start_index, quality_score). start_index is fractional (sub-sample).
     
     Quality score is normalized correlation value (0-1), where 1 is perfect match.
     """
@@ -286,11 +293,60 @@ def find_best_match(needle, haystack, search_start=None, search_end=None):
     quality = peak_value / n_needle
     quality = np.clip(quality, 0.0, 1.0)
     
-    start_idx = peak_idx - (n_needle - 1)
+    start_idx = peak_idx + refine_peak(correlation, peak_idx) - (n_needle - 1)
     
     # Add offset to get position in original haystack
     return start_idx + offset, quality
 
+def match_quality(needle, haystack, search_start, search_end, match_idx):
+    """
+    Quality find_best_match reports for a match at match_idx when searching
+    [search_start, search_end]. The correlation at a given lag does not depend
+    on the search window, but its normalisation does (std of the whole
+    window), so a match found in a wider window is re-scored with this.
+    """
+    search_start = max(0, search_start)
+    search_end = min(len(haystack), search_end)
+    n_needle = len(needle)
+    lag = int(round(match_idx)) - search_start
+    if lag < 0 or lag + n_needle > search_end - search_start:
+        return 0.0
+    
+    needle = needle.astype(np.float32)
+    haystack_window = haystack[search_start:search_end].astype(np.float32)
+    needle -= np.mean(needle)
+    haystack_window -= np.mean(haystack_window)
+    
+    std_needle = np.std(needle)
+    std_haystack = np.std(haystack_window)
+    if std_needle == 0 or std_haystack == 0:
+        return 0.0
+    
+    value = np.dot(needle / std_needle, haystack_window[lag : lag + n_needle] / std_haystack)
+    return float(np.clip(value / n_needle, 0.0, 1.0))
+
+def match_segments_parallel(src_audio, ref_audio, intervals, sample_rate, max_drift_sec=5.0, max_workers=None, initial_offset=0):
+    """
+    Matches all segments against the reference concurrently on a thread pool
+    (numpy FFTs release the GIL). Each segment is searched over a window that
+    covers the cumulative drift it could have accumulated: at most 0.3s per
+    preceding segment, capped at max_drift_sec, around initial_offset.
+    Returns {segment_index: (match_idx, quality)}; quality is relative to the
+    wide window, see match_quality.
+    """
+    def match(item):
+        i, (start, end) = item
+        drift = min(0.3 * i, max_drift_sec) * sample_rate
+        search_start = int(start + initial_offset - drift - 0.2 * sample_rate)
+        search_end = int(end + initial_offset + drift + 0.5 * sample_rate)
+        return i, find_best_match(src_audio[start:end], ref_audio, search_start, search_end)
+    
+    # Segments < 1 second are never matched
+    work = [(i, seg) for i, seg in enumerate(intervals) if seg[1] - seg[0] >= sample_rate]
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(match, work))
+
 def save_wav(audio_data, sample_rate, channels, output_path):
     """
     Saves audio data to a WAV file using ffmpeg.
@@ -308,19 +364,111 @@ def save_wav(audio_data, sample_rate, channels, output_path):
     ]
     
     try:
-        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        process = track_process(subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
         process.communicate(input=audio_data.tobytes())
+        _child_processes.discard(process)
     except Exception as e:
         print(f"Error saving WAV: {e}")
 
-def smart_synchronize(source_file, reference_file, output_file, num_splits=10):
-    ANALYSIS_RATE = 8000
+def render_synchronized(source_file, segment_delays, src_length, ref_length, analysis_rate, output_file,
+                        prefetched_hq=None):
+    """
+    Renders source_file at full quality with each (start, end, delay)
+    segment shifted by its cumulative delay, at least as long as the
+    reference. Lengths and segments are in analysis samples.
+    """
+    ANALYSIS_RATE = analysis_rate
+    
+    if prefetched_hq is not None:
+        src_audio_hq, src_channels, src_rate = prefetched_hq.result()
+    else:
+        # Get source info for HQ reconstruction
+        src_channels, src_rate = get_audio_info(source_file)
+        print(f"Source Audio Info: {src_rate}Hz, {src_channels} channels")
+        
+        print("Extracting full quality Source for reconstruction...")
+        src_audio_hq = get_audio_data(source_file, src_rate, src_channels)
+    
+    # Reconstruct the output audio
+    # Output should be roughly Source length + cumulative delays
+    src_duration = src_length / ANALYSIS_RATE
+    final_delay = segment_delays[-1][2] / ANALYSIS_RATE if segment_delays else 0
+    output_duration = src_duration + final_delay
+    
+    output_len_hq = int(output_duration * src_rate)
+    
+    # Ensure we're at least as long as reference if needed
+    ref_duration = ref_length / ANALYSIS_RATE
+    min_output_len = int(ref_duration * src_rate)
+    if output_len_hq < min_output_len:
+        output_len_hq = min_output_len
     
-    print(f"Loading Source audio for analysis: {source_file}")
-    src_audio_mono = get_audio_data(source_file, ANALYSIS_RATE, target_channels=1)
+    print(f"\nOutput duration: {output_duration:.2f}s (Source: {src_duration:.2f}s + Delay: {final_delay:.2f}s)")
+    
+    if src_channels > 1:
+        output_audio_hq = np.zeros((output_len_hq, src_channels), dtype=np.int16)
+    else:
+        output_audio_hq = np.zeros(output_len_hq, dtype=np.int16)
+    
+    print(f"\nReconstructing audio with incremental delays...")
+    for i, (start, end, cumulative_delay_samples) in enumerate(segment_delays):
+        # Map to HQ indices
+        hq_start_src = int(start * (src_rate / ANALYSIS_RATE))
+        hq_end_src = int(end * (src_rate / ANALYSIS_RATE))
+        hq_len = hq_end_src - hq_start_src
+        
+        # Apply cumulative delay
+        hq_delay = int(round(cumulative_delay_samples * (src_rate / ANALYSIS_RATE)))
+        hq_start_dst = hq_start_src + hq_delay
+        
+        # Bounds check
+        src_limit = len(src_audio_hq)
+        dst_limit = len(output_audio_hq)
+        
+        if hq_start_src + hq_len > src_limit:
+            hq_len = src_limit - hq_start_src
+        
+        if hq_start_dst < 0:
+            # Negative delay - trim the start
+            hq_len += hq_start_dst
+            hq_start_src -= hq_start_dst
+            hq_start_dst = 0
+            
+        if hq_start_dst + hq_len > dst_limit:
+            hq_len = dst_limit - hq_start_dst
+             
+        if hq_len > 0:
+            print(f"  Segment {i+1}: Copying {hq_len} samples from {hq_start_src} to {hq_start_dst} (delay: {hq_delay} samples)")
+            output_audio_hq[hq_start_dst : hq_start_dst + hq_len] = src_audio_hq[hq_start_src : hq_start_src + hq_len]
+            
+    print(f"\nSaving synchronized audio to {output_file}...")
+    save_wav(output_audio_hq, src_rate, src_channels, output_file)
+    print("Done.")
+
+def smart_synchronize(source_file, reference_file, output_file, num_splits=10, analysis_rate=DEFAULT_ANALYSIS_RATE, parallel=False,
+                      preloaded=None, initial_offset=0, prefetched_hq=None):
+    """
+    Synchronizes source to reference segment by segment, splitting at the
+    longest silences. With parallel=True all segments are matched up front
+    on a thread pool, and the cumulative delay logic becomes a cheap
+    sequential pass over the results.
+    preloaded (source, reference) mono analysis audio skips decoding;
+    initial_offset (samples) is the starting cumulative delay.
+    Returns the (start, end, delay) segments in analysis samples; with
+    output_file=None they are returned without rendering anything.
+    prefetched_hq is a background full-quality decode of source_file (an
+    object whose result() returns (audio, channels, sample_rate)).
+    """
+    ANALYSIS_RATE = analysis_rate
     
-    print(f"Loading Reference audio for analysis: {reference_file}")
-    ref_audio_mono = get_audio_data(reference_file, ANALYSIS_RATE, target_channels=1)
+    if preloaded is not None:
+        src_audio_mono, ref_audio_mono = preloaded
+    else:
+        print(f"Loading Source audio for analysis: {source_file}")
+        src_audio_mono = get_audio_data(source_file, ANALYSIS_RATE, target_channels=1)
+        
+        print(f"Loading Reference audio for analysis: {reference_file}")
+        ref_audio_mono = get_audio_data(reference_file, ANALYSIS_RATE, target_channels=1)
     
     # Find ALL silence intervals in source
     silence_intervals = find_silence_intervals(src_audio_mono, ANALYSIS_RATE)
@@ -336,16 +484,15 @@ def smart_synchronize(source_file, reference_file, output_file, num_splits=10):
     intervals = create_segments_from_silences(len(src_audio_mono), top_silences)
     print(f"Created {len(intervals)} audio segments to sync.")
     
-    # Get source info for HQ reconstruction
-    src_channels, src_rate = get_audio_info(source_file)
-    print(f"Source Audio Info: {src_rate}Hz, {src_channels} channels")
-    
-    print("Extracting full quality Source for reconstruction...")
-    src_audio_hq = get_audio_data(source_file, src_rate, src_channels)
+    precomputed = {}
+    if parallel:
+        print(f"Matching {len(intervals)} segments in parallel...")
+        precomputed = match_segments_parallel(src_audio_mono, ref_audio_mono, intervals, ANALYSIS_RATE,
+                                              initial_offset=initial_offset)
     
     # Calculate incremental delays for each segment
     segment_delays = []
-    cumulative_delay = 0  # Track cumulative delay in samples
+    cumulative_delay = initial_offset  # Track cumulative delay in samples
     
     for i, (start, end) in enumerate(intervals):
         segment_len = end - start
@@ -386,7 +533,14 @@ def smart_synchronize(source_file, reference_file, output_file, num_splits=10):
         print(f"  Expected at {expected_pos/ANALYSIS_RATE:.2f}s")
         print(f"  Search window: {search_window_start/ANALYSIS_RATE:.2f}s - {search_window_end/ANALYSIS_RATE:.2f}s")
         
-        match_idx, quality = find_best_match(src_segment, ref_audio_mono, search_window_start, search_window_end)
+        match_idx, quality = precomputed.get(i, (-1, 0.0))
+        # The wide parallel search only stands in for the tight one if its
+        # peak lies inside the tight window; otherwise search again. Its
+        # quality is re-scored over the tight window, as sequential mode sees it.
+        if match_idx == -1 or not (search_window_start <= match_idx <= search_window_end - segment_len):
+            match_idx, quality = find_best_match(src_segment, ref_audio_mono, search_window_start, search_window_end)
+        else:
+            quality = match_quality(src_segment, ref_audio_mono, search_window_start, search_window_end, match_idx)
         
         print(f"  Correlation quality: {quality:.3f}")
         
@@ -456,70 +610,33 @@ def smart_synchronize(source_file, reference_file, output_file, num_splits=10):
         
         segment_delays.append((start, end, cumulative_delay))
     
-    # Reconstruct the output audio
-    # Output should be roughly Source length + cumulative delays
-    src_duration = len(src_audio_mono) / ANALYSIS_RATE
-    final_delay = cumulative_delay / ANALYSIS_RATE
-    output_duration = src_duration + final_delay
+    if output_file is None:
+        return segment_delays
     
-    output_len_hq = int(output_duration * src_rate)
-    
-    # Ensure we're at least as long as reference if needed
-    ref_duration = len(ref_audio_mono) / ANALYSIS_RATE
-    min_output_len = int(ref_duration * src_rate)
-    if output_len_hq < min_output_len:
-        output_len_hq = min_output_len
-    
-    print(f"\nOutput duration: {output_duration:.2f}s (Source: {src_duration:.2f}s + Delay: {final_delay:.2f}s)")
-    
-    if src_channels > 1:
-        output_audio_hq = np.zeros((output_len_hq, src_channels), dtype=np.int16)
-    else:
-        output_audio_hq = np.zeros(output_len_hq, dtype=np.int16)
-    
-    print(f"\nReconstructing audio with incremental delays...")
-    for i, (start, end, cumulative_delay_samples) in enumerate(segment_delays):
-        # Map to HQ indices
-        hq_start_src = int(start * (src_rate / ANALYSIS_RATE))
-        hq_end_src = int(end * (src_rate / ANALYSIS_RATE))
-        hq_len = hq_end_src - hq_start_src
-        
-        # Apply cumulative delay
-        hq_delay = int(cumulative_delay_samples * (src_rate / ANALYSIS_RATE))
-        hq_start_dst = hq_start_src + hq_delay
-        
-        # Bounds check
-        src_limit = len(src_audio_hq)
-        dst_limit = len(output_audio_hq)
-        
-        if hq_start_src + hq_len > src_limit:
-            hq_len = src_limit - hq_start_src
-        
-        if hq_start_dst < 0:
-            # Negative delay - trim the start
-            hq_len += hq_start_dst
-            hq_start_src -= hq_start_dst
-            hq_start_dst = 0
-            
-        if hq_start_dst + hq_len > dst_limit:
-            hq_len = dst_limit - hq_start_dst
-             
-        if hq_len > 0:
-            print(f"  Segment {i+1}: Copying {hq_len} samples from {hq_start_src} to {hq_start_dst} (delay: {hq_delay} samples)")
-            output_audio_hq[hq_start_dst : hq_start_dst + hq_len] = src_audio_hq[hq_start_src : hq_start_src + hq_len]
-            
-    print(f"\nSaving synchronized audio to {output_file}...")
-    save_wav(output_audio_hq, src_rate, src_channels, output_file)
-    print("Done.")
+    render_synchronized(source_file, segment_delays, len(src_audio_mono), len(ref_audio_mono), ANALYSIS_RATE,
+                        output_file, prefetched_hq)
+    return segment_delays
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: python smart_synchronize.py <source_mkv> <reference_mkv> <output_wav> [num_splits]")
+    parallel = '--parallel' in sys.argv
+    argv = [arg for arg in sys.argv if arg != '--parallel']
+    
+    if len(argv) < 4:
+        print("Usage: python smart_synchronize.py <source_mkv> <reference_mkv> <output_wav> [num_splits] [analysis_rate] [--parallel]")
         sys.exit(1)
         
-    source_file = sys.argv[1]
-    reference_file = sys.argv[2]
-    output_file = sys.argv[3]
-    num_splits = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+    source_file = argv[1]
+    reference_file = argv[2]
+    output_file = argv[3]
+    num_splits = int(argv[4]) if len(argv) > 4 else 10
+    analysis_rate = int(argv[5]) if len(argv) > 5 else DEFAULT_ANALYSIS_RATE
     
-    smart_synchronize(source_file, reference_file, output_file, num_splits)
+    install_cancel_handlers()
+    try:
+        smart_synchronize(source_file, reference_file, output_file, num_splits, analysis_rate, parallel)
+    except SyncCancelled:
+        print("Cancelled. Stopping decoders and removing partial output...")
+        _temp_files.add(output_file)
+        sys.exit(130)
+    finally:
+        release_resources()
@@ -0,0 +1,67 @@
+import os
+import signal
+import numpy as np
+
+# Helpers shared by adaptive_sync.py and smart_synchronize.py
+
+# Default analysis sample rate. Correlation peaks are refined to sub-sample
+# precision, so lower rates (2000-4000 Hz) keep sub-millisecond accuracy.
+DEFAULT_ANALYSIS_RATE = 8000
+
+class SyncCancelled(BaseException):
+    """
+    Raised when the process is asked to stop (SIGTERM/SIGINT).
+    Derives from BaseException so generic error handlers do not swallow it.
+    """
+
+# Child processes and temporary files to release on cancellation.
+# Shared by both analysers, so one release covers every engine.
+_child_processes = set()
+_temp_files = set()
+
+def _on_terminate(signum, frame):
+    raise SyncCancelled()
+
+def install_cancel_handlers():
+    """Turns termination signals into SyncCancelled in the main thread."""
+    for name in ('SIGTERM', 'SIGINT', 'SIGBREAK'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), _on_terminate)
+
+def track_process(process):
+    """Registers a child process so it is killed on cancellation."""
+    _child_processes.add(process)
+    return process
+
+def release_resources():
+    """Kills tracked child processes and removes tracked temporary files."""
+    for process in list(_child_processes):
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+    _child_processes.clear()
+
+    for path in list(_temp_files):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    _temp_files.clear()
+
+def refine_peak(correlation, peak_idx):
+    """
+    Refines an integer correlation peak using parabolic interpolation.
+    Returns the fractional offset (-0.5 to 0.5) to add to peak_idx.
+    """
+    if peak_idx <= 0 or peak_idx >= len(correlation) - 1:
+        return 0.0
+
+    y0 = correlation[peak_idx - 1]
+    y1 = correlation[peak_idx]
+    y2 = correlation[peak_idx + 1]
+
+    denom = y0 - 2 * y1 + y2
+    if denom >= 0:
+        return 0.0  # Not a local maximum (flat or concave up)
+
+    return float(np.clip(0.5 * (y0 - y2) / denom, -0.5, 0.5))
@@ -0,0 +1,108 @@
+const path = require('path');
+const fs = require('fs');
+const os = require('os');
+const { spawn } = require('child_process');
+const { enqueueJob } = require('./lib/queue');
+
+// Starts several worker.js processes in --dry-run mode on a temporary queue
+// and checks that every job runs exactly once, including when a worker is
+// killed mid-job and its lease is taken over.
+//
+//   node test_queue.js
+
+const WORKER = path.join(__dirname, 'worker.js');
+
+function startWorker(queueDir, args) {
+    const child = spawn(process.execPath, [WORKER, queueDir, '--lease', '1.5', '--poll', '0.1', ...args], {
+        stdio: ['ignore', 'ignore', 'pipe']
+    });
+    child.stderr.on('data', (data) => process.stderr.write(data));
+    child.exited = new Promise(resolve => child.on('exit', resolve));
+    return child;
+}
+
+async function makeQueue(jobCount) {
+    const queueDir = await fs.promises.mkdtemp(path.join(os.tmpdir(), 'sync-queue-'));
+    for (let i = 0; i < jobCount; i++) {
+        await enqueueJob(queueDir, { source: `/episodes/src/${i}.mkv`, target: `/episodes/tgt/${i}.mkv`, trackIndex: 1 });
+    }
+    return queueDir;
+}
+
+async function readJobs(queueDir) {
+    const jobsDir = path.join(queueDir, 'jobs');
+    const jobs = [];
+    for (const id of (await fs.promises.readdir(jobsDir)).sort()) {
+        const dir = path.join(jobsDir, id);
+        const log = await fs.promises.readFile(path.join(dir, 'job.log'), 'utf8').catch(() => '');
+        const result = JSON.parse(await fs.promises.readFile(path.join(dir, 'result.json'), 'utf8').catch(() => 'null'));
+        jobs.push({
+            id,
+            result,
+            runs: log.split('\n').filter(line => line.includes('Dry run:')).length,
+            takeovers: log.split('\n').filter(line => line.includes('Took over')).length
+        });
+    }
+    return jobs;
+}
+
+async function waitForResults(queueDir, timeoutMs) {
+    const until = Date.now() + timeoutMs;
+    while (Date.now() < until) {
+        const jobs = await readJobs(queueDir);
+        if (jobs.every(job => job.result)) return jobs;
+        await new Promise(resolve => setTimeout(resolve, 100));
+    }
+    throw new Error('Timed out waiting for the queue to drain');
+}
+
+function check(condition, message) {
+    if (!condition) throw new Error(message);
+    console.log(`  ok - ${message}`);
+}
+
+async function testExactlyOnce() {
+    console.log('Several workers drain a queue:');
+    const queueDir = await makeQueue(24);
+    const workers = Array.from({ length: 4 }, () => startWorker(queueDir, ['--once', '--dry-run', '0.2']));
+    await Promise.all(workers.map(w => w.exited));
+
+    const jobs = await readJobs(queueDir);
+    check(jobs.every(job => job.result && job.result.status === 'done'), 'every job finished');
+    check(jobs.every(job => job.runs === 1), 'every job ran exactly once');
+    const owners = new Set(jobs.map(job => job.result.worker));
+    check(owners.size > 1, `work was shared (${owners.size} workers)`);
+    await fs.promises.rm(queueDir, { recursive: true, force: true });
+}
+
+async function testTakeover() {
+    console.log('A killed worker\'s job is taken over once:');
+    const queueDir = await makeQueue(8);
+    const workers = Array.from({ length: 3 }, () => startWorker(queueDir, ['--dry-run', '1.0']));
+
+    // Every worker is holding a job by now
+    await new Promise(resolve => setTimeout(resolve, 600));
+    workers[0].kill('SIGKILL');
+
+    const jobs = await waitForResults(queueDir, 30000);
+    for (const worker of workers.slice(1)) worker.kill('SIGTERM');
+    await Promise.all(workers.map(w => w.exited));
+
+    check(jobs.every(job => job.result.status === 'done'), 'every job finished');
+    const retaken = jobs.filter(job => job.takeovers > 0);
+    check(retaken.length === 1, 'exactly one job was taken over');
+    check(retaken[0].runs === 2, 'the taken over job ran again once');
+    check(jobs.filter(job => job.takeovers === 0).every(job => job.runs === 1), 'every other job ran exactly once');
+    await fs.promises.rm(queueDir, { recursive: true, force: true });
+}
+
+async function main() {
+    await testExactlyOnce();
+    await testTakeover();
+    console.log('All queue tests passed.');
+}
+
+main().catch((e) => {
+    console.error(`FAILED: ${e.message}`);
+    process.exit(1);
+});
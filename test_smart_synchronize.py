@@ -0,0 +1,62 @@
+import numpy as np
+
+from smart_synchronize import smart_synchronize
+
+# Parallel matching must give the same delay map as sequential matching.
+# Run with: python -m pytest test_smart_synchronize.py
+
+SR = 8000
+
+def build_title(seed=7):
+    """
+    Source: speech-like noise blocks split by silences. Reference: the same
+    blocks, delayed by 1.0s and then by a further 0.15s from the fourth
+    block on, plus background noise. A loud burst sits just before the
+    fifth block: inside the wide parallel search window, outside the tight one.
+    """
+    rng = np.random.default_rng(seed)
+    blocks = [int(d * SR) for d in (18, 22, 15, 25, 20, 17)]
+    gap = int(1.5 * SR)
+
+    src = []
+    starts = []
+    pos = 0
+    for n in blocks:
+        starts.append(pos)
+        src.append((rng.standard_normal(n) * 3000).astype(np.int16))
+        src.append(np.zeros(gap, np.int16))
+        pos += n + gap
+    src = np.concatenate(src)
+
+    ref = np.zeros(len(src) + 4 * SR, np.float32)
+    for i, (start, n) in enumerate(zip(starts, blocks)):
+        delay = int(1.0 * SR) + (int(0.15 * SR) if i >= 3 else 0)
+        ref[start + delay : start + delay + n] += src[start : start + n]
+    ref += rng.standard_normal(len(ref)) * 300
+
+    # Full-scale square wave from 1.35s to 0.25s before the fifth block's expected position
+    expected = starts[4] + int(1.15 * SR)
+    burst = np.arange(expected - int(1.35 * SR), expected - int(0.25 * SR))
+    ref[burst] = np.where((burst // 20) % 2 == 0, 32000, -32000)
+    return src, np.clip(ref, -32768, 32767).astype(np.int16)
+
+def run(src, ref, parallel):
+    return smart_synchronize('source', 'reference', None, parallel=parallel, preloaded=(src, ref),
+                             initial_offset=1.0 * SR)
+
+def test_parallel_matches_sequential():
+    src, ref = build_title()
+    sequential = run(src, ref, parallel=False)
+    parallel = run(src, ref, parallel=True)
+
+    assert len(sequential) == len(parallel)
+    for (s1, e1, d1), (s2, e2, d2) in zip(sequential, parallel):
+        assert (s1, e1) == (s2, e2)
+        assert abs(d1 - d2) < 1e-6
+
+    # The burst must not hide the 0.15s step from either mode
+    assert abs(sequential[-1][2] - 1.15 * SR) < 0.01 * SR
+
+if __name__ == "__main__":
+    test_parallel_matches_sequential()
+    print("OK")
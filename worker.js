@@ -0,0 +1,182 @@
+const path = require('path');
+const fs = require('fs');
+const { matchEpisodes } = require('./lib/utils');
+const { getMediaInfo } = require('./lib/ffmpeg');
+const { JobSupervisor } = require('./lib/supervisor');
+const { processSync } = require('./lib/pipeline');
+const { DEFAULT_LEASE_MS, newWorkerId, enqueueJob, claimNextJob, recentResults, readJson } = require('./lib/queue');
+
+// Batch worker for a shared directory queue. Run one per machine (or
+// several per machine) against the same folder on a shared filesystem:
+//
+//   node worker.js <queueDir> --enqueue <sourceFolder> <targetFolder>
+//   node worker.js <queueDir> [--once] [--lease <sec>] [--poll <sec>] [--rate <hz>]
+//
+// --dry-run <sec> claims jobs and holds each one for <sec> instead of syncing
+// it, to check a queue setup (see test_queue.js).
+
+// Delay maps of finished episodes from the same source folder, used as a prior
+const PRIOR_EPISODES = 5;
+
+const USAGE = 'Usage: node worker.js <queueDir> [--enqueue <sourceFolder> <targetFolder>] [--once] [--lease <sec>] [--poll <sec>] [--rate <hz>] [--max-decoders <n>] [--dry-run <sec>]';
+
+function parseArgs(argv) {
+    const options = { queueDir: null, enqueue: null, once: false, leaseMs: DEFAULT_LEASE_MS, pollMs: 5000, analysisRate: null, maxDecoders: null, dryRunMs: null };
+    for (let i = 0; i < argv.length; i++) {
+        const arg = argv[i];
+        if (arg === '--enqueue') {
+            options.enqueue = { sourceFolder: argv[++i], targetFolder: argv[++i] };
+        } else if (arg === '--once') {
+            options.once = true;
+        } else if (arg === '--lease') {
+            options.leaseMs = parseFloat(argv[++i]) * 1000;
+        } else if (arg === '--poll') {
+            options.pollMs = parseFloat(argv[++i]) * 1000;
+        } else if (arg === '--rate') {
+            options.analysisRate = parseInt(argv[++i]);
+        } else if (arg === '--max-decoders') {
+            options.maxDecoders = parseInt(argv[++i]);
+        } else if (arg === '--dry-run') {
+            options.dryRunMs = parseFloat(argv[++i]) * 1000;
+        } else if (!options.queueDir) {
+            options.queueDir = path.resolve(arg);
+        }
+    }
+    return options;
+}
+
+async function enqueueFolders(queueDir, sourceFolder, targetFolder) {
+    const sourceFiles = (await fs.promises.readdir(sourceFolder)).filter(f => f.endsWith('.mkv'));
+    const targetFiles = (await fs.promises.readdir(targetFolder)).filter(f => f.endsWith('.mkv'));
+
+    const matches = matchEpisodes(sourceFiles, targetFiles);
+    for (const { source, target } of matches) {
+        const id = await enqueueJob(queueDir, {
+            source: path.resolve(sourceFolder, source),
+            target: path.resolve(targetFolder, target),
+            trackIndex: null // First audio track, as in batch mode
+        });
+        console.log(`Queued ${id}: ${source} -> ${target}`);
+    }
+    console.log(`Queued ${matches.length} job(s) in ${queueDir}`);
+}
+
+async function loadPrior(queueDir, spec) {
+    const folder = path.dirname(spec.source);
+    const recent = await recentResults(queueDir,
+        (other, result) => result.status === 'done' && result.delayMap && path.dirname(other.source) === folder,
+        PRIOR_EPISODES);
+    return recent.map(({ result }) => result.delayMap).reverse();
+}
+
+// Holds a claimed job without running it; stops early when cancelled
+async function dryRun(job, durationMs, log) {
+    log(`Dry run: holding the job for ${durationMs / 1000}s`);
+    const until = Date.now() + durationMs;
+    while (Date.now() < until && !job.cancelled) {
+        await new Promise(resolve => setTimeout(resolve, Math.min(50, until - Date.now())));
+    }
+    job.throwIfCancelled();
+}
+
+async function runClaim(claim, state, options) {
+    const spec = await readJson(path.join(claim.dir, 'job.json'));
+    const job = new JobSupervisor();
+    state.current = { claim, job };
+    claim.onLost = () => {
+        console.log(`[${claim.id}] Lease lost to another worker, aborting.`);
+        job.cancel();
+    };
+
+    // Serialise log writes so job.log keeps its order
+    let logChain = Promise.resolve();
+    const log = (message, type = 'info') => {
+        console.log(`[${claim.id}] ${message}`);
+        logChain = logChain.then(() => claim.appendLog(message, type)).catch(() => { });
+    };
+
+    try {
+        log(`Claimed by ${claim.workerId}`);
+        if (options.dryRunMs !== null) {
+            await dryRun(job, options.dryRunMs, log);
+            await logChain;
+            await claim.complete({ status: 'done', output: null, dryRun: true });
+            return;
+        }
+
+        let trackIndex = spec.trackIndex;
+        if (trackIndex === null || trackIndex === undefined) {
+            const info = await getMediaInfo(spec.source);
+            trackIndex = info.audioTracks.length > 0 ? info.audioTracks[0].index : 1;
+        }
+
+        const prior = await loadPrior(options.queueDir, spec);
+        if (prior.length > 0) log(`Using delay maps of ${prior.length} earlier episode(s) as a prior`);
+
+        let delayMap = null;
+        const output = await processSync(spec.source, spec.target, trackIndex, {
+            job,
+            outputDir: spec.outputDir || path.join(claim.dir, 'output'),
+            scriptPath: path.join(__dirname, 'adaptive_sync.py'),
+            log,
+            analysisRate: options.analysisRate,
+            maxDecoders: options.maxDecoders,
+            prior,
+            onDelayMap: (map) => { delayMap = map; }
+        });
+        await logChain;
+        await claim.complete({ status: 'done', output, delayMap });
+    } catch (e) {
+        log(`Failed: ${e.message}`, 'error');
+        await logChain;
+        if (state.stopping) {
+            await claim.release(); // Leave it for another worker
+        } else {
+            await claim.complete({ status: 'failed', error: e.message });
+        }
+    } finally {
+        state.current = null;
+    }
+}
+
+async function main() {
+    const options = parseArgs(process.argv.slice(2));
+    if (!options.queueDir) {
+        console.log(USAGE);
+        process.exit(1);
+    }
+
+    if (options.enqueue) {
+        await enqueueFolders(options.queueDir, options.enqueue.sourceFolder, options.enqueue.targetFolder);
+        return;
+    }
+
+    const workerId = newWorkerId();
+    const state = { stopping: false, current: null };
+    console.log(`Worker ${workerId} watching ${options.queueDir}`);
+
+    const stop = () => {
+        if (state.stopping) return;
+        console.log('Stopping worker...');
+        state.stopping = true;
+        if (state.current) state.current.job.cancel();
+    };
+    process.on('SIGINT', stop);
+    process.on('SIGTERM', stop);
+
+    while (!state.stopping) {
+        const claim = await claimNextJob(options.queueDir, workerId, options.leaseMs);
+        if (claim) {
+            await runClaim(claim, state, options);
+            continue;
+        }
+        if (options.once) break;
+        await new Promise(resolve => setTimeout(resolve, options.pollMs));
+    }
+    console.log(`Worker ${workerId} finished.`);
+}
+
+main().catch((e) => {
+    console.error(e);
+    process.exit(1);
+});